@@ -24,9 +24,11 @@ package.
 setup(
     name         = 'django-view-shortcuts',
     version      = '1.3.5',
-    packages     = ['view_shortcuts'],
+    packages     = ['view_shortcuts', 'view_shortcuts.management',
+                    'view_shortcuts.management.commands',
+                    'view_shortcuts.migrations'],
 
-    requires = ['python (>= 2.4)', 'django (>= 1.0)'],
+    requires = ['python (>= 3.8)', 'django (>= 4.1)'],
 
     description  = 'A set of shortcuts for Django views.',
     long_description = long_description,
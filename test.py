@@ -10,13 +10,22 @@
 #  Software Foundation. See the file README for copying conditions.
 #
 
+import django
 from django.conf import settings
 from django.core.management import call_command
 
 settings.configure(
     INSTALLED_APPS=('view_shortcuts',),
-    DATABASE_ENGINE='sqlite3'
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3'}},
+    DEFAULT_AUTO_FIELD='django.db.models.AutoField',
+    SECRET_KEY='view-shortcuts-tests',
+    TIME_ZONE='UTC',
+    USE_TZ=True,
+    # test models are defined in view_shortcuts.tests which the migrations
+    # know nothing about, so the tables are created without migrating
+    MIGRATION_MODULES={'view_shortcuts': None},
 )
+django.setup()
 
 if __name__ == "__main__":
     call_command('test', 'view_shortcuts')
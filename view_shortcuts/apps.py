@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2008--2009 Andy Mikhailenko and contributors
+#
+#  This file is part of Django View Shortcuts.
+#
+#  Django View Shortcuts is free software under terms of the GNU Lesser
+#  General Public License version 3 (LGPLv3) as published by the Free
+#  Software Foundation. See the file README for copying conditions.
+#
+
+from django.apps import AppConfig
+
+
+class ViewShortcutsConfig(AppConfig):
+    name = 'view_shortcuts'
+    # keep the primary key of FacetCount as in the migration regardless of
+    # the project's DEFAULT_AUTO_FIELD
+    default_auto_field = 'django.db.models.AutoField'
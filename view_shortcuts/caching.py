@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2008--2009 Andy Mikhailenko and contributors
+#
+#  This file is part of Django View Shortcuts.
+#
+#  Django View Shortcuts is free software under terms of the GNU Lesser
+#  General Public License version 3 (LGPLv3) as published by the Free
+#  Software Foundation. See the file README for copying conditions.
+#
+
+" Caching of facet choice counts. "
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.db.models.sql import Query
+from django.db.models.sql.where import WhereNode
+
+
+class LRUCache(object):
+    """A small thread-safe in-process cache with expiring entries. The least
+    recently used entry is dropped when the cache is full.
+    """
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.time() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FacetCache(object):
+    """Stores choice counts of filters in a Django cache backend with a
+    per-process LRU cache in front of it.
+
+    Only (value, items_count) pairs and raw values of label columns (see the
+    ``label`` option of RelationFilter) are stored; titles are built from them
+    on each request, so the same entry serves all locales.
+
+    Entries are keyed by a fingerprint of the filter's count query and by the
+    "generation" of each model involved in the query. Saving or deleting an
+    object (or changing a many-to-many relation) bumps the generation of its
+    model, so that stale entries are never read again and simply expire.
+    Only models involved in some cached query have a generation, so changes
+    in other models cost nothing. Generations are kept in the process for
+    ``generation_timeout`` seconds, thus changes made by other processes may
+    show up with such a delay.
+
+    Usage:
+
+        cache = FacetCache(backend='default', timeout=60)
+        filters = FilterList(request, qs, facets, cache=cache)
+
+    Timeout can be set for a single facet, too:
+
+        facet('category', cache_timeout=600)
+    """
+    def __init__(self, backend='default', timeout=300, max_size=256,
+                 prefix='view_shortcuts.facets', generation_timeout=5):
+        self.backend = backend
+        self.timeout = timeout
+        self.prefix = prefix
+        self.generation_timeout = generation_timeout
+        self.local = LRUCache(max_size)
+        self.generations = LRUCache(max_size)
+
+    @property
+    def storage(self):
+        return caches[self.backend]
+
+    def fingerprint(self, f, query=None):
+        "Returns a stable hash identifying rows that would be fetched by the filter."
+        query = query or f.counts_query().query
+        sql, params = query.sql_with_params()
+        data = repr((f.qs.model._meta.label, f.__class__.__name__, f.lookup,
+                     f.active, sql, params))
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def _generation_key(self, model):
+        return '%s:gen:%s' % (self.prefix, model._meta.label_lower)
+
+    def get_generations(self, models):
+        """Returns generations of given models. Models seen for the first
+        time get one, so that their changes are followed from now on.
+        """
+        keys = [self._generation_key(m) for m in models]
+        # zero marks a model known to have no generation
+        generations = dict((k, self.generations.get(k)) for k in keys)
+        missing = [k for k in keys if not generations[k]]
+        if missing:
+            generations.update(self.storage.get_many(missing))
+        for key in missing:
+            if key not in generations or not generations[key]:
+                # a timestamp never matches generations the model had before
+                # its key was evicted
+                generations[key] = int(time.time() * 1000)
+                if not self.storage.add(key, generations[key], None):
+                    generations[key] = self.storage.get(key, generations[key])
+            self.generations.set(key, generations[key], self.generation_timeout)
+        return [generations[k] for k in keys]
+
+    def _get_key(self, f):
+        query = f.counts_query().query
+        versions = ','.join(str(g) for g in self.get_generations(get_query_models(query)))
+        return '%s:%s:%s' % (self.prefix, self.fingerprint(f, query), versions)
+
+    def get(self, f):
+        "Returns cached counts for given filter or None."
+        key = self._get_key(f)
+        counts = self.local.get(key)
+        if counts is None:
+            counts = self.storage.get(key)
+            if counts is not None:
+                self.local.set(key, counts, self.get_timeout(f))
+        f._cache_key = key
+        return counts
+
+    def set(self, f, counts):
+        key = getattr(f, '_cache_key', None) or self._get_key(f)
+        timeout = self.get_timeout(f)
+        self.local.set(key, counts, timeout)
+        self.storage.set(key, counts, timeout)
+
+    def get_timeout(self, f):
+        return f.options.get('cache_timeout', self.timeout)
+
+    def invalidate(self, model):
+        "Makes all cached counts that depend on given model obsolete."
+        key = self._generation_key(model)
+        generation = self.generations.get(key)
+        if generation is None:
+            generation = self.storage.get(key, 0)
+        if generation:
+            try:
+                generation = self.storage.incr(key)
+            except ValueError:
+                # the key has just been evicted; entries keyed with it will
+                # not be read again as the model gets a new generation
+                generation = 0
+        self.generations.set(key, generation, self.generation_timeout)
+
+
+_table_models = {}
+
+def get_query_models(query):
+    """Returns models which tables are used by given query, including its
+    subqueries (e.g. EXISTS conditions or ``__in`` lookups with querysets).
+    """
+    if not _table_models:
+        for model in apps.get_models(include_auto_created=True):
+            _table_models[model._meta.db_table] = model
+    tables = set()
+    _collect_tables(query, tables)
+    models = [_table_models[t] for t in tables if t in _table_models]
+    return sorted(models, key=lambda m: m._meta.label_lower)
+
+def _collect_tables(query, tables):
+    tables.update(join.table_name for join in query.alias_map.values())
+    for combined in query.combined_queries:
+        _collect_tables(combined, tables)
+    nodes = [query.where] + list(query.annotations.values())
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, Query):
+            _collect_tables(node, tables)
+        elif isinstance(node, WhereNode):
+            nodes.extend(node.children)
+        elif hasattr(node, 'get_source_expressions'):
+            nodes.extend(e for e in node.get_source_expressions() if e is not None)
+
+
+_default_cache = None
+
+def get_default_cache():
+    """Returns the FacetCache configured with settings:
+
+    * VIEW_SHORTCUTS_FACET_CACHE -- name of the Django cache backend
+      (default: "default");
+    * VIEW_SHORTCUTS_FACET_CACHE_TIMEOUT -- default timeout (300 seconds);
+    * VIEW_SHORTCUTS_FACET_CACHE_SIZE -- size of the in-process cache (256);
+    * VIEW_SHORTCUTS_FACET_CACHE_GENERATION_TIMEOUT -- number of seconds to
+      keep model generations in the process (5).
+
+    Note that if VIEW_SHORTCUTS_FACET_CACHE is set, every process invalidates
+    the cache on model changes, even if it never used the cache itself.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FacetCache(
+            backend  = getattr(settings, 'VIEW_SHORTCUTS_FACET_CACHE', 'default'),
+            timeout  = getattr(settings, 'VIEW_SHORTCUTS_FACET_CACHE_TIMEOUT', 300),
+            max_size = getattr(settings, 'VIEW_SHORTCUTS_FACET_CACHE_SIZE', 256),
+            generation_timeout = getattr(
+                settings, 'VIEW_SHORTCUTS_FACET_CACHE_GENERATION_TIMEOUT', 5),
+        )
+    return _default_cache
+
+
+_caches = []
+
+def register(cache):
+    "Makes the cache follow changes in models."
+    if cache not in _caches:
+        _caches.append(cache)
+
+def _invalidate(sender, **kwargs):
+    if getattr(settings, 'VIEW_SHORTCUTS_FACET_CACHE', None):
+        register(get_default_cache())
+    for cache in _caches:
+        cache.invalidate(sender)
+
+post_save.connect(_invalidate, dispatch_uid='view_shortcuts.caching.post_save')
+post_delete.connect(_invalidate, dispatch_uid='view_shortcuts.caching.post_delete')
+
+def _invalidate_m2m(sender, action, **kwargs):
+    # the sender is the intermediate model
+    if action.startswith('post_'):
+        _invalidate(sender)
+
+m2m_changed.connect(_invalidate_m2m, dispatch_uid='view_shortcuts.caching.m2m_changed')
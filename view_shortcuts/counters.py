@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2008--2009 Andy Mikhailenko and contributors
+#
+#  This file is part of Django View Shortcuts.
+#
+#  Django View Shortcuts is free software under terms of the GNU Lesser
+#  General Public License version 3 (LGPLv3) as published by the Free
+#  Software Foundation. See the file README for copying conditions.
+#
+
+"""
+Precomputed facet counts.
+
+Counting choices for a facet means aggregating over the whole queryset. For
+large tables this can be replaced with reading a few rows from a side table
+(see view_shortcuts.models.FacetCount) which is kept up to date on each
+change of the model. The table is created by ``manage.py migrate`` once
+view_shortcuts is in INSTALLED_APPS.
+
+Usage (e.g. in models.py):
+
+    from view_shortcuts import counters
+
+    counters.register(Story, 'status')
+    counters.register(Story, 'categories__slug', scopes={
+        'all': {},
+        'published': {'status': Story.PUBLISHED},
+    })
+
+Any FilterList built on a queryset which equals one of the scopes (e.g.
+``Story.objects.filter(status=Story.PUBLISHED)``) will then read the counts
+for these facets from the table.
+
+Counts are updated on saving and deleting objects of the model and on changes
+of its many-to-many relations. Changes in other models (e.g. renaming a
+category in the above example) are not tracked; run the management command
+``rebuild_facet_counts`` after such changes or periodically.
+"""
+
+from collections import Counter
+from django.db import IntegrityError, models
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+
+
+def _get_storage():
+    # imported lazily so that view_shortcuts needs to be in INSTALLED_APPS
+    # only if counters are actually used
+    from .models import FacetCount
+    return FacetCount
+
+
+class FacetCounter(object):
+    "Maintains counts of objects per value of a lookup within given scopes."
+
+    def __init__(self, model, lookup, scopes=None):
+        self.model = model
+        self.lookup = lookup
+        self.scopes = scopes or {'all': {}}
+
+    def __repr__(self):
+        return '<FacetCounter %s.%s>' % (self.model._meta.label, self.lookup)
+
+    @property
+    def label(self):
+        return self.model._meta.label_lower
+
+    def get_scope_queryset(self, scope):
+        conditions = self.scopes[scope]
+        qs = self.model._default_manager.all()
+        if isinstance(conditions, models.Q):
+            return qs.filter(conditions)
+        return qs.filter(**conditions)
+
+    def match(self, qs):
+        "Returns name of the scope which equals given queryset or None."
+        if qs.model is not self.model:
+            return None
+        sql = qs.order_by().query.sql_with_params()
+        for scope in self.scopes:
+            if self.get_scope_queryset(scope).order_by().query.sql_with_params() == sql:
+                return scope
+        return None
+
+    def get_rows(self, scope, limit=None, min_count=None):
+        "Returns stored counts in the format of Filter.counts_query()."
+        rows = _get_storage().objects.filter(model=self.label, lookup=self.lookup,
+                                             scope=scope, items_count__gt=0)
+        if min_count:
+            rows = rows.filter(items_count__gte=min_count)
+        rows = rows.values('items_count', facet_value=models.F('value'))
+        if limit:
+            rows = rows.order_by('-items_count', 'value')[:limit + 1]
+        return rows
+
+    def get_values(self, pks):
+        """Returns a dictionary of scope names and values of the lookup for
+        objects with given primary keys.
+        """
+        values = {}
+        for scope in self.scopes:
+            qs = self.get_scope_queryset(scope).filter(pk__in=pks)
+            values[scope] = Counter(
+                _to_text(v) for _, v in set(qs.values_list('pk', self.lookup)))
+        return values
+
+    def update(self, old, new):
+        "Applies difference between two results of ``get_values``."
+        for scope in self.scopes:
+            delta = Counter(new.get(scope, {}))
+            delta.subtract(old.get(scope, {}))
+            for value, diff in delta.items():
+                if diff:
+                    self._add(scope, value, diff)
+
+    def _add(self, scope, value, diff):
+        FacetCount = _get_storage()
+        rows = FacetCount.objects.filter(model=self.label, lookup=self.lookup,
+                                         scope=scope, value=value)
+        if rows.update(items_count=models.F('items_count') + diff) or diff < 0:
+            return
+        try:
+            FacetCount.objects.create(model=self.label, lookup=self.lookup,
+                                      scope=scope, value=value, items_count=diff)
+        except IntegrityError:
+            # created by a concurrent request
+            rows.update(items_count=models.F('items_count') + diff)
+
+    def rebuild(self):
+        "Recounts all values from scratch."
+        FacetCount = _get_storage()
+        FacetCount.objects.filter(model=self.label, lookup=self.lookup).delete()
+        for scope in self.scopes:
+            qs = self.get_scope_queryset(scope).order_by().values(self.lookup)
+            qs = qs.annotate(items_count=models.Count('pk', distinct=True))
+            FacetCount.objects.bulk_create(
+                FacetCount(model=self.label, lookup=self.lookup, scope=scope,
+                           value=_to_text(row[self.lookup]),
+                           items_count=row['items_count'])
+                for row in qs)
+
+
+def _to_text(value):
+    return None if value is None else str(value)
+
+
+_registry = {}
+
+def register(model, lookup, scopes=None):
+    """Declares that counts for given model and lookup should be stored.
+    Scopes are named sets of conditions (a dictionary of lookups or a Q
+    object); by default all objects are counted within the scope "all".
+    """
+    counter = FacetCounter(model, lookup, scopes)
+    _registry.setdefault(model, {})[lookup] = counter
+    return counter
+
+def unregister(model, lookup):
+    "Stops maintaining counts for given model and lookup."
+    _registry.get(model, {}).pop(lookup, None)
+    if not _registry.get(model, True):
+        del _registry[model]
+
+def get_counters(model=None):
+    "Returns registered counters (for given model, if specified)."
+    if model is not None:
+        return list(_registry.get(model, {}).values())
+    return [c for counters in _registry.values() for c in counters.values()]
+
+def get_counts(f):
+    """Returns stored counts for given filter if its queryset matches one of
+    registered scopes; otherwise returns None.
+    """
+    counter = _registry.get(f.qs.model, {}).get(f.lookup)
+    if counter is None:
+        return None
+    scope = counter.match(f.qs)
+    if scope is None:
+        return None
+    if f.get_domain() is not None:
+        # the values are put into buckets by the filter, so all of them count
+        return counter.get_rows(scope)
+    return counter.get_rows(scope, f.limit, f.options.get('min_count'))
+
+
+#
+# Signal handlers
+#
+
+def _take_snapshot(model, pks):
+    return dict((c, c.get_values(pks)) for c in get_counters(model))
+
+def _apply_snapshot(model, pks, snapshot):
+    for counter in get_counters(model):
+        counter.update(snapshot.get(counter, {}), counter.get_values(pks))
+
+def _on_pre_save(sender, instance, raw=False, **kwargs):
+    if sender in _registry and not raw:
+        pks = [instance.pk] if instance.pk is not None else []
+        instance._facet_counts_snapshot = _take_snapshot(sender, pks)
+
+def _on_post_save(sender, instance, raw=False, **kwargs):
+    if sender in _registry and not raw:
+        snapshot = getattr(instance, '_facet_counts_snapshot', {})
+        _apply_snapshot(sender, [instance.pk], snapshot)
+
+def _on_pre_delete(sender, instance, **kwargs):
+    if sender in _registry:
+        instance._facet_counts_snapshot = _take_snapshot(sender, [instance.pk])
+
+def _on_post_delete(sender, instance, **kwargs):
+    if sender in _registry:
+        old = getattr(instance, '_facet_counts_snapshot', {})
+        for counter, values in old.items():
+            counter.update(values, {})
+
+def _on_m2m_changed(sender, instance, action, model, pk_set, **kwargs):
+    # find out which objects of a registered model are affected
+    if instance.__class__ in _registry:
+        fact_model, pks = instance.__class__, [instance.pk]
+    elif model in _registry:
+        fact_model = model
+        if pk_set is not None:
+            pks = list(pk_set)
+        elif action == 'pre_clear':
+            pks = list(getattr(instance, _get_accessor(sender, instance, model))
+                       .values_list('pk', flat=True))
+        else:
+            pks = getattr(instance, '_facet_counts_pks', [])
+    else:
+        return
+    if action.startswith('pre_'):
+        instance._facet_counts_pks = pks
+        instance._facet_counts_snapshot = _take_snapshot(fact_model, pks)
+    else:
+        snapshot = getattr(instance, '_facet_counts_snapshot', {})
+        _apply_snapshot(fact_model, pks, snapshot)
+
+def _get_accessor(through, instance, model):
+    """Returns name of the instance attribute that manages the relation to
+    given model via given intermediate model.
+    """
+    for field in instance._meta.many_to_many:
+        if field.remote_field.through is through:
+            return field.name
+    for field in model._meta.many_to_many:
+        if field.remote_field.through is through:
+            return field.remote_field.get_accessor_name()
+    raise LookupError('%s does not relate %s to %s' % (through, instance, model))
+
+pre_save.connect(_on_pre_save, dispatch_uid='view_shortcuts.counters.pre_save')
+post_save.connect(_on_post_save, dispatch_uid='view_shortcuts.counters.post_save')
+pre_delete.connect(_on_pre_delete, dispatch_uid='view_shortcuts.counters.pre_delete')
+post_delete.connect(_on_post_delete, dispatch_uid='view_shortcuts.counters.post_delete')
+m2m_changed.connect(_on_m2m_changed, dispatch_uid='view_shortcuts.counters.m2m_changed')
@@ -11,13 +11,12 @@
 #
 
 from django.http import HttpRequest
-from django.template import RequestContext
-from django.shortcuts import render_to_response
+from django.shortcuts import render
 
 def render_to(template=None):
     """
-    Decorator for Django views that sends returned dict to render_to_response
-    function with given template and RequestContext as context instance.
+    Decorator for Django views that sends returned dict to render function with
+    given template and request.
 
     If view doesn't return dict then decorator simply returns output.
     Additionally view can return two-tuple, which must contain dict as first
@@ -65,7 +64,7 @@ def render_to(template=None):
 
             # process results
             if isinstance(output, (list, tuple)):
-                return render_to_response(output[1], output[0], RequestContext(request))
+                return render(request, output[1], output[0])
             elif isinstance(output, dict):
                 # if template not specified, use view function name instead
                 if template:
@@ -76,7 +75,7 @@ def render_to(template=None):
                                          'with anonymous functions if template '\
                                          'name is not provided.')
                     tmpl = '%s.html' % func.__name__
-                return render_to_response(tmpl, output, RequestContext(request))
+                return render(request, tmpl, output)
             return output
         # preserve custom attributes of the view function
         wrapper.__dict__ = dict(func.__dict__)
@@ -11,13 +11,215 @@
 
 " A set of typical QuerySet filters for ordinary views. "
 
+import asyncio
+import copy
+import datetime
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
-from django.db import models
-from django.utils.translation import ugettext_lazy as _
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db import connections, models
+from django.db.models.functions import Cast, Lower, Mod, Substr, Trunc
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+from django.utils import formats, timezone
+from django.utils.translation import gettext_lazy as _
+from . import caching, counters
 from .decorators import cached_property
 
 
+class LookupPath(object):
+    """A facet lookup resolved against a model: the chain of fields it spans,
+    the last relation in the chain (e.g. "author__country" for lookup
+    "author__country__code"), the related model and its attribute that holds
+    the values ("code"; "pk" if the lookup ends with a relation).
+
+    Parts following the last field are transforms (e.g. "pub_date__year")
+    and, at the very end, a lookup (e.g. "author__name__iexact"). The values
+    are selected by ``value_lookup`` which only keeps the transforms;
+    ``target_field`` is the field of the transformed values.
+    """
+    def __init__(self, model, lookup):
+        self.model = model
+        self.lookup = lookup
+        self.fields = []
+        parts = lookup.split('__')
+        current = model
+        for name in parts:
+            if current is None:
+                break
+            try:
+                if name == 'pk':
+                    field = current._meta.pk
+                else:
+                    field = current._meta.get_field(name)
+            except FieldDoesNotExist:
+                if not self.fields:
+                    raise
+                break
+            self.fields.append(field)
+            current = field.related_model if field.is_relation else None
+        names = parts[:len(self.fields)]
+        relations = [i for i, f in enumerate(self.fields) if f.is_relation]
+        if relations:
+            last = relations[-1]
+            self.relation = '__'.join(names[:last + 1])
+            self.related_model = self.fields[last].related_model
+            self.attr = '__'.join(names[last + 1:]) or 'pk'
+        else:
+            self.relation = self.related_model = self.attr = None
+        target = self.fields[-1]
+        if target.is_relation:
+            target = getattr(target, 'target_field', None) or target.related_model._meta.pk
+        self.lookup_name = None
+        suffix = parts[len(self.fields):]
+        for i, name in enumerate(suffix):
+            transform = target.get_transform(name)
+            if transform is not None:
+                target = transform(models.Value(None, output_field=target)).output_field
+                names.append(name)
+            elif i == len(suffix) - 1 and target.get_lookup(name) is not None:
+                self.lookup_name = name
+            else:
+                raise FieldError('Unsupported lookup "%s" in "%s"' % (name, lookup))
+        self.value_lookup = '__'.join(names)
+        self.target_field = target
+        # True if an object may match more than one value of the lookup
+        self.many = any(f.many_to_many or f.one_to_many
+                        for f in self.fields if f.is_relation)
+
+    def __repr__(self):
+        return '<LookupPath %s.%s>' % (self.model._meta.label, self.lookup)
+
+
+_lookup_paths = {}
+_lookup_paths_lock = threading.Lock()
+
+def resolve_lookup(model, lookup):
+    """Returns the LookupPath for given model and lookup. Each pair is
+    resolved once per process.
+    """
+    key = (model, lookup)
+    path = _lookup_paths.get(key)
+    if path is None:
+        path = LookupPath(model, lookup)
+        with _lookup_paths_lock:
+            path = _lookup_paths.setdefault(key, path)
+    return path
+
+
+_estimates = {}
+
+def estimate_count(qs, timeout=300):
+    """Returns approximate number of rows in the table of given queryset's
+    model. Table statistics are used where available (PostgreSQL, MySQL),
+    otherwise the rows are counted. The result is kept for ``timeout`` seconds.
+    """
+    connection = connections[qs.db]
+    table = qs.model._meta.db_table
+    key = (qs.db, table)
+    expires, count = _estimates.get(key, (0, None))
+    if expires > time.time():
+        return count
+    if connection.vendor in ('postgresql', 'mysql'):
+        if connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+        else:
+            sql = 'SELECT table_rows FROM information_schema.tables ' \
+                  'WHERE table_schema = DATABASE() AND table_name = %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        count = int(row[0] or 0) if row else 0
+    else:
+        count = qs.model._default_manager.using(qs.db).count()
+    _estimates[key] = (time.time() + timeout, count)
+    return count
+
+
+def closing_connections(func):
+    """Wraps the function so that database connections opened by the current
+    thread are closed afterwards. Meant for functions called in worker threads
+    which would otherwise leave their connections open.
+    """
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+_executor = None
+_connection_slots = None
+_executor_lock = threading.Lock()
+
+def get_default_executor():
+    """Returns the thread pool shared by all FilterList instances in executor
+    mode. Its size is taken from VIEW_SHORTCUTS_FACET_WORKERS (default: 4).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'VIEW_SHORTCUTS_FACET_WORKERS', 4),
+                thread_name_prefix='view_shortcuts.facets')
+        return _executor
+
+def _get_connection_slots():
+    """Returns the semaphore that limits the number of facets evaluated in
+    worker threads at once (VIEW_SHORTCUTS_FACET_MAX_CONNECTIONS, 10).
+    """
+    global _connection_slots
+    with _executor_lock:
+        if _connection_slots is None:
+            _connection_slots = threading.BoundedSemaphore(
+                getattr(settings, 'VIEW_SHORTCUTS_FACET_MAX_CONNECTIONS', 10))
+        return _connection_slots
+
+
+def get_date_bounds(year, month=None, day=None):
+    """Returns the first day of given year, month or day and the first day
+    after it.
+    """
+    year = int(year)
+    if month is None:
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    month = int(month)
+    if day is None:
+        start = datetime.date(year, month, 1)
+        return start, datetime.date(year + month // 12, month % 12 + 1, 1)
+    start = datetime.date(year, month, int(day))
+    return start, start + datetime.timedelta(days=1)
+
+def get_date_range(field, year, month=None, day=None):
+    """Returns a half-open range (start, end) of given year, month or day
+    suitable for ``gte`` and ``lt`` lookups on the field: midnights in the
+    current time zone for DateTimeFields, dates otherwise.
+    """
+    start, end = get_date_bounds(year, month, day)
+    return to_field_value(field, start), to_field_value(field, end)
+
+def to_field_value(field, date):
+    """Converts the date to midnight in the current time zone if the field is
+    a DateTimeField.
+    """
+    if isinstance(field, models.DateTimeField):
+        date = datetime.datetime.combine(date, datetime.time())
+        if settings.USE_TZ:
+            date = timezone.make_aware(date)
+    return date
+
+def get_today():
+    "Returns current date in the current time zone."
+    if settings.USE_TZ:
+        return timezone.localdate()
+    return datetime.date.today()
+
+
 def filter_date(items, field_name, year, month=None, day=None):
     """
     Filters given queryset by date if any provided. Accepts three scopes: year, month and day.
@@ -39,13 +241,21 @@ def filter_date(items, field_name, year, month=None, day=None):
         def my_entry_list(request, year=None, month=None, day=None):
             entries = Entry.objects.all()
             entries = filter_date(entries, 'pub_date', year, month, day)
+
+    The period is selected with a half-open range (e.g. ``pub_date >= 2009-03-01
+    AND pub_date < 2009-04-01``) which can be answered from an index on the
+    field. For DateTimeFields the bounds are midnights in the current time
+    zone. An invalid period (e.g. month "13" or April 31) matches nothing.
     """
     if year:
-        items = items.filter(**{'%s__year'  % field_name : year})
-        if month:
-            items = items.filter(**{'%s__month' % field_name : month})
-            if day:
-                items = items.filter(**{'%s__day' % field_name : day})
+        field = resolve_lookup(items.model, field_name).target_field
+        try:
+            start, end = get_date_range(field, year, month or None,
+                                        month and day or None)
+        except (TypeError, ValueError):
+            return items.none()
+        items = items.filter(**{'%s__gte' % field_name: start,
+                                '%s__lt'  % field_name: end})
     return items
 
 def filter_date_range(items, start, end):
@@ -65,22 +275,42 @@ def filter_date_range(items, start, end):
             people = Entry.objects.all()
             # show all entries of this year
             people = filter_date_range(people, ('joined', from_year), ('left', to_year))
-    """
-
-    def __make_qargs(mode, field_name, year, month, day):
-        q_field = '%s__%s' % (field_name, mode)
-        q_date  = '%s-%s-%s' % (year, month, day)
-        return {q_field:q_date}
 
-    def __make_qargs_till(field_name, year, month='12', day='31'):
-        return __make_qargs('lte', field_name, year, month, day)
-
-    def __make_qargs_from(field_name, year, month='01', day='01'):
-        return __make_qargs('gte', field_name, year, month, day)
-
-    qargs = dict(__make_qargs_from(*start), **__make_qargs_till(*end))
-    items = items.filter(**qargs)
-    return items
+    The bounds are computed as dates (or datetimes in the current time zone
+    for DateTimeFields) before the query is built: the range starts with the
+    first day of the start period and ends before the day following the end
+    period (e.g. ('left', 2009, 2) stands for "left < 2009-03-01"). A bound
+    with empty year is omitted. Like in filter_date, an invalid date (e.g.
+    April 31) or an empty range on a single field (the start period ending
+    after the end period) matches nothing.
+    """
+    try:
+        lower = _get_range_bound(items, start, 0)
+        upper = _get_range_bound(items, end, 1)
+    except (TypeError, ValueError):
+        return items.none()
+    if lower is not None and upper is not None and start[0] == end[0] \
+            and lower >= upper:
+        return items.none()
+    conditions = {}
+    if lower is not None:
+        conditions['%s__gte' % start[0]] = lower
+    if upper is not None:
+        conditions['%s__lt' % end[0]] = upper
+    return items.filter(**conditions)
+
+def _get_range_bound(items, bound, index):
+    """Returns the beginning (index 0) or the end (index 1) of the period
+    given as (field_name, year, [month, [day]]) converted for lookups on the
+    field. Returns None if the year is empty.
+    """
+    field_name, period = bound[0], list(bound[1:])
+    while period and period[-1] in (None, ''):
+        period.pop()
+    if not period:
+        return None
+    field = resolve_lookup(items.model, field_name).target_field
+    return get_date_range(field, *period)[index]
 
 def filter_field(items, field_name, value):
     """
@@ -152,13 +382,80 @@ class facet(dict):
     ...     facet('author__pk', 'author', AlphabetRelationFilter),
     ... )
     >>> FilterList(qs, request, facets)
+
+    Extra keywords are passed to the Filter as options:
+
+    * cache_timeout -- number of seconds to cache choice counts for (if the
+      FilterList is cached, see view_shortcuts.caching.FacetCache);
+    * approximate -- overrides the FilterList keyword of the same name;
+    * limit -- maximum number of choices to fetch (the most popular ones are
+      chosen). The filter's ``has_more`` and ``remaining`` attributes tell
+      whether some choices were left out; ``get_more_choices()`` fetches them;
+    * min_count -- minimum number of items for a choice to be displayed;
+    * multiple -- allows to select several choices at once (items matching
+      any of them are shown). The values are read with ``getlist()`` and
+      applied with a single ``__in`` lookup. It is best combined with the
+      FilterList keyword ``drill_sideways`` so that the facet's own
+      selection does not hide other choices;
+    * exists -- for lookups spanning multi-valued relations (many-to-many
+      or reverse foreign keys): whether to filter with an EXISTS subquery
+      instead of a join (default: True);
+    * label -- for relations: name of the related model's field (relative to
+      the last relation in the lookup) to be used as choice title. It is
+      fetched by the same query as the counts, so related objects are not
+      instantiated. By default titles are built by calling ``str()`` on
+      related objects.
     """
-    def __init__(self, lookup, param=None, kind=None):
+    def __init__(self, lookup, param=None, kind=None, **options):
         super(dict, self).__init__()
         if kind: assert issubclass(kind, Filter)
         self['lookup'] = lookup
         self['param']  = param or lookup
         self['kind']   = kind or Filter
+        self['options'] = options
+
+    @classmethod
+    def coerce(cls, p):
+        "Returns a facet for given facet, (lookup, param) pair or lookup."
+        if isinstance(p, facet):
+            return p
+        if isinstance(p, (tuple,list)):
+            warnings.warn("using tuple for lookup/param coupling is "\
+                          "deprecated, use filters.facet() instead.",
+                          DeprecationWarning, 3)
+            return cls(*p)
+        return cls(p)
+
+
+class FacetSet(list):
+    """A list of facets compiled for a model once, e.g. on import of views.py.
+    Lookups are resolved and validated (an invalid one fails right away
+    instead of on the first request), Filter classes are chosen and titles
+    of explicit choices are mapped, so that a FilterList built with the set
+    only has to bind request values and run the queries.
+
+    Example:
+
+        STORY_FACETS = FacetSet(Story, (facet('author'), facet('status')))
+
+        def story_list(request):
+            filters = FilterList(request, Story.objects.all(), STORY_FACETS)
+    """
+    def __init__(self, model, params):
+        self.model = model
+        super(FacetSet, self).__init__(self.compile(p) for p in params)
+
+    def compile(self, p):
+        p = facet.coerce(p)
+        path = resolve_lookup(self.model, p['lookup'])
+        kind = p['kind']
+        if kind is Filter:
+            kind = Filter.get_filter_class(path.fields[0])
+            if kind is None:
+                raise ValueError('No filter is suitable for %s' % path)
+        if path.fields[0].choices:
+            get_choice_titles(path.fields[0])
+        return facet(p['lookup'], p['param'], kind, **p['options'])
 
 class FilterList(list):
     """Filters given queryset by multiple fields with their values automatically
@@ -172,6 +469,36 @@ class FilterList(list):
     The keyword 'single' allows to filter by only one parameter even if multiple
     are provided in the request.
 
+    The keyword 'combined' makes all filters fetch their choice counts with a
+    single query (UNION ALL of per-facet aggregations) on first access to
+    choices of any of them.
+
+    The keyword 'drill_sideways' makes each filter count its choices with
+    respect to all other active filters (but not itself), so that a choice
+    never leads to an empty list. Inactive filters share the same query, so
+    only active ones add distinct aggregations.
+
+    The keyword 'cache' enables caching of choice counts. It accepts a
+    view_shortcuts.caching.FacetCache instance or True for the default one.
+
+    The keyword 'approximate' allows to estimate choice counts from a sample
+    of objects which primary keys are divisible by the sample rate (e.g. each
+    100th object). The value is either the rate or True for the default one
+    (VIEW_SHORTCUTS_SAMPLE_RATE, 100). Sampling is only used if the table
+    contains more than 'approximate_threshold' rows (the default is taken
+    from VIEW_SHORTCUTS_APPROXIMATE_THRESHOLD, 1000000). Such choices are
+    marked as approximate.
+
+    The keyword 'executor' makes the filters generate their choices in
+    parallel on a thread pool: either a concurrent.futures.Executor or True
+    for the shared one (see ``get_default_executor``). It can be enabled for
+    all lists with VIEW_SHORTCUTS_FACET_EXECUTOR = True. Each worker thread
+    uses its own database connection and closes it when done. If too many
+    facets are being evaluated in worker threads already (see
+    VIEW_SHORTCUTS_FACET_MAX_CONNECTIONS), the rest are evaluated in the
+    calling thread. Note that worker threads do not see uncommitted changes
+    of the calling thread.
+
     Example One
     -----------
 
@@ -259,40 +586,152 @@ class FilterList(list):
             return dict(filters=filters, object_list=object_list)
     """
 
-    def __init__(self, request, qs, params, single=False, sort_by_usage=True):
+    def __init__(self, request, qs, params, single=False, sort_by_usage=True,
+                 combined=False, drill_sideways=False, cache=None,
+                 approximate=False, approximate_threshold=None, executor=None):
         self._qs = qs
         self.single = single
+        self.combined = combined
+        if cache is True:
+            cache = caching.get_default_cache()
+        if cache is not None:
+            caching.register(cache)
+        self.cache = cache
+        if executor is None:
+            executor = getattr(settings, 'VIEW_SHORTCUTS_FACET_EXECUTOR', None)
+        if executor is True:
+            executor = get_default_executor()
+        self.executor = executor or None
+        if isinstance(params, FacetSet) and not issubclass(qs.model, params.model):
+            raise ValueError('Facets for %s cannot be applied to %s'
+                             % (params.model._meta.label, qs.model._meta.label))
         def _generate_filters(request, qs, params, single, sort_by_usage):
             single_triggered = False
             for p in params:
-                klass = Filter
-                if isinstance(p, facet):
-                    lookup, param, klass = p['lookup'], p['param'], p['kind']
-                elif isinstance(p, (tuple,list)):
-                    warnings.warn("using tuple for lookup/param coupling is "\
-                                  "deprecated, use filters.facet() instead.",
-                                  DeprecationWarning, 2)
-                    lookup, param = p
-                else:
-                    lookup = param = p
+                p = facet.coerce(p)
+                lookup, param, klass = p['lookup'], p['param'], p['kind']
+                options = p['options']
                 active = False
-                value = request.GET.get(param)
+                if options.get('multiple'):
+                    value = [v for v in request.GET.getlist(param) if v]
+                else:
+                    value = request.GET.get(param)
                 if value and not single_triggered:
                     if single:
                         single_triggered = True
                     active = True
-                f = klass.create(param, qs, lookup, value, active, sort_by_usage)
+                f = klass.create(param, qs, lookup, value, active, sort_by_usage,
+                                 **options)
+                f.filter_list = self
+                f.cache = cache
                 yield f
         super(FilterList, self).__init__(
             _generate_filters(request, qs, params, single, sort_by_usage)
         )
+        if drill_sideways:
+            self._drill_sideways()
+        self._set_sample_rates(approximate, approximate_threshold)
+
+    def _set_sample_rates(self, approximate, threshold):
+        """Enables sampling for filters that allow approximate counts if the
+        table is large enough.
+        """
+        rates = {}
+        for f in self:
+            rate = f.options.get('approximate', approximate)
+            if rate is True:
+                rate = getattr(settings, 'VIEW_SHORTCUTS_SAMPLE_RATE', 100)
+            if rate and rate > 1 and isinstance(self._qs.model._meta.pk,
+                                                models.IntegerField):
+                rates[f] = rate
+        if not rates:
+            return
+        if threshold is None:
+            threshold = getattr(settings, 'VIEW_SHORTCUTS_APPROXIMATE_THRESHOLD',
+                                1000000)
+        if estimate_count(self._qs) > threshold:
+            for f, rate in rates.items():
+                f.sample_rate = rate
+
+    def _drill_sideways(self):
+        """Restricts the queryset of each filter by all active filters except
+        the filter itself. Inactive filters are given the same queryset
+        instance (the fully filtered one), so there are at most N+1 distinct
+        count queries for N active filters.
+        """
+        active = self.active
+        if not active:
+            return
+        restricted = self._qs.filter(*[f.get_condition() for f in active])
+        for f in self:
+            if f in active:
+                f.qs = self._qs.filter(*[o.get_condition() for o in active if o is not f])
+            else:
+                f.qs = restricted
+
+    def fetch_counts(self):
+        """Fetches choice counts for all filters which do not have them yet.
+        In combined mode the per-facet aggregations are tagged by facet param
+        and glued together with UNION ALL, so that the database is hit once;
+        the rows are then dispatched back to the filters.
+        """
+        pending = [f for f in self
+                   if f._counts is None and not f.load_precomputed()]
+        if not self.combined:
+            for f in pending:
+                f.set_counts(f.counts_query())
+            return
+        # some backends cannot limit parts of a compound statement
+        features = connections[self._qs.db].features
+        if not features.supports_slicing_ordering_in_compound:
+            for f in [f for f in pending if f.limit]:
+                f.set_counts(f.counts_query())
+                pending.remove(f)
+        if len(pending) < 2:
+            for f in pending:
+                f.set_counts(f.counts_query())
+            return
+        # filters with fixed domains group the items by the index of the value
+        # they match, so that each facet is still counted with a single scan
+        queries = [f.counts_query(combined=True) if f.get_domain() is None
+                   else f.get_domain_query() for f in pending]
+        rows = {}
+        for row in queries[0].union(*queries[1:], all=True):
+            rows.setdefault(row['facet_param'], []).append(row)
+        for f in pending:
+            if f.get_domain() is None:
+                f.set_counts(rows.get(f.param, []))
+            else:
+                f.set_counts([f.gather_row(rows.get(f.param, []))])
+
+    def fetch_choices(self):
+        """Generates choices for all filters which do not have them yet. In
+        executor mode the filters are evaluated in parallel.
+        """
+        pending = [f for f in self if getattr(f, '_cache__choices', None) is None]
+        if self.combined:
+            self.fetch_counts()
+        if self.executor is None:
+            for f in pending:
+                f.choices
+            return
+        slots = _get_connection_slots()
+        futures = []
+        for f in pending:
+            if slots.acquire(blocking=False):
+                futures.append((f, self.executor.submit(_generate_choices, f, slots)))
+            else:
+                f._cache__choices = list(f.generate_choices())
+        for f, future in futures:
+            f._cache__choices = future.result()
 
     @cached_property
     def urlencode(self):
         """Encodes currently active filters so that they could be
         added to an URL as query string.
         """
-        return urlencode([(f.param, f.value) for f in self.active])
+        return urlencode([(f.param, value) for f in self.active
+                                           for value in f.values])
 
     @cached_property
     def active(self):
@@ -310,7 +749,7 @@ class FilterList(list):
         """Applies currently active filters (known from the Request object)
         to the predefined QuerySet and returns the resulting QuerySet object.
         """
-        return self._qs & self.clean_query
+        return self._qs.filter(self.get_q())
 
     @cached_property
     def clean_query(self):
@@ -331,12 +770,67 @@ class FilterList(list):
         Of course custom query managers are also reset.
         """
 
-        q = self._qs.model.objects.all()        # TODO use _default_manager?
+        return self._qs.model.objects.filter(self.get_q())  # TODO use _default_manager?
+
+    def get_q(self):
+        """Returns a Q object combining conditions of all active filters, so
+        that they are applied to a queryset at once.
+        """
+        q = models.Q()
         for f in self.active:
-            q = f.filter(q)
+            q &= f.get_condition()
         return q
 
 
+@closing_connections
+def _generate_choices(f, slots):
+    try:
+        return list(f.generate_choices())
+    finally:
+        slots.release()
+
+
+class AsyncFilterList(FilterList):
+    """A FilterList for asynchronous views. Choices of all filters are fetched
+    concurrently, each filter in a separate thread with its own database
+    connection, so the time it takes equals to the slowest query instead of
+    the sum of all of them.
+
+    Note that the queries are run outside of the view's transaction (if any).
+
+    Usage:
+
+        async def my_entry_list(request):
+            filters = AsyncFilterList(request, Entry.objects.all(), facets)
+            await filters.afetch_choices()
+            object_list = await filters.aobject_list()
+            ...
+
+    After ``afetch_choices()`` the ``choices`` of each filter can be accessed
+    in templates as usual.
+    """
+
+    def _set_sample_rates(self, approximate, threshold):
+        # estimating table size requires a query; postponed to afetch_choices()
+        self._sampling = approximate, threshold
+
+    async def afetch_choices(self):
+        "Fetches choices of all filters concurrently."
+        await sync_to_async(FilterList._set_sample_rates)(self, *self._sampling)
+        if self.combined:
+            await sync_to_async(closing_connections(self.fetch_counts),
+                                thread_sensitive=False)()
+        await asyncio.gather(*[f.achoices() for f in self])
+
+    async def aobject_list(self):
+        "Returns the list of objects matching currently active filters."
+        return [obj async for obj in self.object_list]
+
+    async def aclean_query(self):
+        "Returns the list of objects built from scratch (see ``clean_query``)."
+        return [obj async for obj in self.clean_query]
+
+
 class Filter(object):
     """ A facet filter. Objects of this class are instantiated by filter_params()
     and returned along with the queryset.
@@ -354,16 +848,29 @@ class Filter(object):
 
     # TODO replace (qs, lookup, param) with (model, attribute) and let specify other stuff _if needed_.
 
-    _cached_fields = {}
     _filter_specs = []
-    def __init__(self, param, qs, lookup, value, active=False, sort_by_usage=False):
+    _filter_classes = {}
+    _filter_classes_lock = threading.Lock()
+    filter_list = None
+    cache = None
+    sample_rate = None
+    approximate = False
+    _counts = None
+    _objects = ()
+    _labels = None
+    count_distinct = False
+    def __init__(self, param, qs, lookup, value, active=False, sort_by_usage=False,
+                 **options):
         self.param = param
         self.qs = qs
         self.lookup = lookup
         self.value = value
         self.active = active
         self.sort_by_usage = sort_by_usage
-        self.field = self.resolve_field(qs, lookup)
+        self.options = options
+        # the lookup resolved against the model (see LookupPath)
+        self.path = resolve_lookup(qs.model, lookup)
+        self.field = self.path.fields[0]
 
     def __repr__(self):
         return '<%s "%s": %s>' % (self.__class__.__name__, self.param, self.active)
@@ -379,34 +886,63 @@ class Filter(object):
         class appears to be "all values" too, do not register it -- just specify
         it in your views in a facet.
         """
-        cls._filter_specs.append(factory)
+        with Filter._filter_classes_lock:
+            cls._filter_specs.append(factory)
+            Filter._filter_classes.clear()
 
     @staticmethod
     def resolve_field(qs, lookup):
-        f = None
-        if lookup not in Filter._cached_fields:
-            # we need the "author" part of "author__pk" lookup
-            f = qs.model._meta.get_field(lookup.split('__')[0])
-        return Filter._cached_fields.setdefault(lookup, f)
+        # we need the "author" part of "author__pk" lookup
+        return resolve_lookup(qs.model, lookup).fields[0]
+
+    @staticmethod
+    def get_filter_class(field):
+        """Returns the first registered class suitable for given field (or
+        None). The choice is remembered for each field.
+        """
+        try:
+            return Filter._filter_classes[field]
+        except KeyError:
+            pass
+        with Filter._filter_classes_lock:
+            for factory in Filter._filter_specs:
+                if factory.suitable_for(field):
+                    break
+            else:
+                factory = None
+            Filter._filter_classes[field] = factory
+        return factory
 
     @classmethod
-    def create(cls, param, qs, lookup, value, active=False, sort_by_usage=True):
+    def create(cls, param, qs, lookup, value, active=False, sort_by_usage=True,
+               **options):
         # chosen by user
         if not cls == Filter:
-            return cls(param, qs, lookup, value, active, sort_by_usage)
+            return cls(param, qs, lookup, value, active, sort_by_usage, **options)
         # autoselect
-        field = cls.resolve_field(qs,lookup)
-        for factory in cls._filter_specs:
-            if factory.suitable_for(field):
-                return factory(param, qs, lookup, value, active, sort_by_usage)
+        factory = cls.get_filter_class(cls.resolve_field(qs, lookup))
+        if factory is not None:
+            return factory(param, qs, lookup, value, active, sort_by_usage,
+                           **options)
 
     @classmethod
     def suitable_for(cls, field):
         return True
 
+    @property
+    def multiple(self):
+        return bool(self.options.get('multiple'))
+
+    @property
+    def values(self):
+        "Returns the list of current values."
+        if self.multiple:
+            return self.value or []
+        return [self.value] if self.value else []
+
     @cached_property
     def urlencode(self):
-        return urlencode({self.param: self.value})
+        return urlencode({self.param: self.value}, doseq=self.multiple)
 
     def extra_title(self):
         """Filter subclasses may overload this method to provide extra sources
@@ -418,11 +954,266 @@ class Filter(object):
     @cached_property
     def title(self):
         "Returns human-readable field name (if accessible)."
-        return str(self.field.verbose_name or self.extra_title())
+        # reverse relations have no verbose name of their own
+        return str(getattr(self.field, 'verbose_name', None) or self.extra_title())
 
     def generate_choices(self):
         raise NotImplementedError
 
+    @property
+    def limit(self):
+        return self.options.get('limit')
+
+    def counts_query(self, combined=False, offset=0, limit=None):
+        """Returns a values() queryset with unique values of the facet lookup
+        (as ``facet_value``) annotated with ``items_count``. If ``combined``
+        is True, the query is prepared for being merged with queries of other
+        facets: values are cast to text and the facet param is added as
+        ``facet_param``.
+
+        If the facet is limited (or ``limit`` is given), only the most popular
+        values are fetched starting from ``offset``, plus one extra value that
+        tells whether there are more of them.
+        """
+        choices = self._counts_query(combined)
+        limit = limit or self.limit
+        if limit and self.get_domain() is None:
+            choices = choices.order_by('-items_count', 'facet_value')
+            choices = choices[offset:offset + limit + 1]
+        return choices
+
+    def _counts_query(self, combined=False):
+        domain = self.get_domain()
+        if domain is not None:
+            # a single row of conditional aggregates, one per value
+            choices = self.sample(self.qs.order_by())
+            if not domain:
+                choices = choices.none()
+            return choices.values(facet_row=models.Value(1, models.IntegerField())) \
+                          .annotate(**self.get_aggregates())
+        value = self.get_value_expression()
+        columns = {}
+        label = self.get_label_expression()
+        if label is not None:
+            columns['facet_label'] = label
+        if combined:
+            value = Cast(value, models.TextField())
+            columns['facet_label'] = Cast(
+                label if label is not None else models.Value(None),
+                models.TextField())
+        else:
+            columns.update(self.get_object_columns())
+        choices = self.sample(self.get_counted_queryset().order_by())
+        choices = choices.values(facet_value=value, **columns)
+        choices = self._annotate(choices)
+        if self.options.get('min_count'):
+            choices = choices.filter(items_count__gte=self.options['min_count'])
+        if combined:
+            choices = choices.order_by().annotate(
+                facet_param=models.Value(self.param, models.CharField()))
+        return choices
+
+    def sample(self, qs):
+        "Restricts given queryset to the sample if the filter is approximate."
+        if self.sample_rate:
+            qs = qs.alias(facet_sample=Mod('pk', self.sample_rate))
+            qs = qs.filter(facet_sample=0)
+        return qs
+
+    def get_counted_queryset(self):
+        "Returns the queryset which objects are counted for each choice."
+        return self.qs
+
+    def get_domain(self):
+        """Returns a list of (value, Q) pairs if the filter has a small fixed
+        set of values, or None. Such filters are counted with conditional
+        aggregates in a single row instead of grouping by value (in combined
+        mode, see ``get_domain_query``). The values are expected to be
+        disjoint.
+        """
+        return None
+
+    def get_aggregates(self):
+        "Returns conditional aggregates counting items for each value of the domain."
+        return dict(('facet_%d' % i,
+                     models.Count('pk', filter=q, distinct=self.count_distinct))
+                    for i, (value, q) in enumerate(self.get_domain()))
+
+    def get_domain_query(self):
+        """Returns a query which groups the items by the index of the first
+        value of the domain they match, so that the whole domain is counted
+        with a single scan like with ``get_aggregates``. The rows have the
+        columns of combined ``counts_query`` (with the index as
+        ``facet_value``), so that the query could be a part of the compound
+        statement; ``gather_row`` turns them back into a row of aggregates.
+        """
+        text = models.TextField()
+        index = models.Case(*[models.When(q, then=models.Value(i))
+                              for i, (value, q) in enumerate(self.get_domain())])
+        qs = self.sample(self.qs.order_by())
+        return qs.values(facet_value=Cast(index, text),
+                         facet_label=Cast(models.Value(None), text)) \
+                 .annotate(items_count=models.Count('pk', distinct=self.count_distinct),
+                           facet_param=models.Value(self.param, models.CharField()))
+
+    def gather_row(self, rows):
+        """Converts rows fetched by ``get_domain_query`` to a row of
+        conditional aggregates. Items matching no value are left out.
+        """
+        row = dict(('facet_%s' % r['facet_value'], r['items_count'])
+                   for r in rows if r['facet_value'] is not None)
+        return dict(row, facet_row=1)
+
+    def expand_row(self, row):
+        """Converts a row of conditional aggregates to rows in the format of
+        ``counts_query``. Unused values are left out.
+        """
+        min_count = self.options.get('min_count') or 1
+        rows = []
+        for i, (value, q) in enumerate(self.get_domain()):
+            items_count = row.get('facet_%d' % i, 0)
+            if items_count >= min_count:
+                rows.append({'facet_value': value, 'items_count': items_count})
+        return rows
+
+    def expand_rows(self, rows):
+        """Converts rows of conditional aggregates and rows stored in counter
+        tables per value (see ``get_buckets``) to rows with counts for the
+        values of the domain.
+        """
+        expanded, totals = [], {}
+        for row in rows:
+            if 'facet_row' in row:
+                expanded.extend(self.expand_row(row))
+                continue
+            for value in self.get_buckets(row['facet_value']):
+                totals[value] = totals.get(value, 0) + row['items_count']
+        min_count = self.options.get('min_count') or 1
+        expanded.extend({'facet_value': value, 'items_count': items_count}
+                        for value, items_count in totals.items()
+                        if items_count >= min_count)
+        return expanded
+
+    def get_buckets(self, value):
+        """Returns values of the domain that given value of the lookup (as
+        stored in counter tables) falls into.
+        """
+        return [value]
+
+    def get_value_expression(self):
+        "Returns an expression for values the items are grouped by."
+        return models.F(self.path.value_lookup)
+
+    def get_label_expression(self):
+        """Returns an expression for choice titles to be fetched along with
+        the counts, or None if titles are built otherwise.
+        """
+        return None
+
+    def get_object_columns(self):
+        """Returns a dictionary of expressions for the objects the values
+        refer to, fetched along with the counts (except in combined mode) if
+        choice titles are built from the objects themselves.
+        """
+        return {}
+
+    def to_python(self, value):
+        "Converts a value fetched from the database to the lookup field's type."
+        return self.path.target_field.to_python(value)
+
+    def convert_counts(self, rows, scale=1):
+        """Converts rows fetched by ``counts_query`` to a list of
+        (value, items_count) pairs and a dictionary of labels (if they were
+        fetched, see ``get_label_expression``). Counts are multiplied by
+        ``scale``.
+        """
+        counts, labels = [], {}
+        if self.get_domain() is not None:
+            rows = self.expand_rows(rows)
+        for row in rows:
+            value = self.to_python(row['facet_value'])
+            counts.append((value, row['items_count'] * scale))
+            if row.get('facet_label') is not None:
+                labels[value] = row['facet_label']
+        if self.sort_by_usage:
+            counts.sort(key=lambda c: -c[1])
+        return counts, labels
+
+    def set_counts(self, rows):
+        "Stores rows fetched by ``counts_query``."
+        self._counts, self._labels = self.convert_counts(rows, self.sample_rate or 1)
+        self.approximate = bool(self.sample_rate)
+        if self.cache is not None:
+            self.cache.set(self, (self._counts, self._labels))
+
+    def load_precomputed(self):
+        """Picks counts from counter tables or cache (if any). Returns True on
+        success.
+        """
+        rows = counters.get_counts(self)
+        if rows is not None:
+            self._counts, self._labels = self.convert_counts(rows)
+        elif self.cache is not None:
+            cached = self.cache.get(self)
+            if cached is not None:
+                self._counts, self._labels = cached
+                self.approximate = bool(self.sample_rate)
+        return self._counts is not None
+
+    def get_counts(self):
+        """Returns a list of (value, items_count) pairs. In combined mode the
+        query is delegated to the FilterList so that it could fetch counts for
+        all its filters at once.
+        """
+        if self._counts is None and not self.load_precomputed():
+            if self.filter_list is not None and self.filter_list.combined:
+                self.filter_list.fetch_counts()
+            else:
+                self.set_counts(self.counts_query())
+        if self.limit:
+            # the extra value only signals that there are more of them
+            return self._counts[:self.limit]
+        return self._counts
+
+    def get_labels(self):
+        "Returns a dictionary of choice titles fetched along with the counts."
+        self.get_counts()
+        return self._labels
+
+    @property
+    def has_more(self):
+        "Returns True if some choices were left out due to the limit."
+        return bool(self.limit) and len(self.get_counts()) < len(self._counts)
+
+    @cached_property
+    def remaining(self):
+        "Returns the number of choices left out due to the limit."
+        if not self.has_more:
+            return 0
+        if self.get_domain() is not None:
+            # all values of the domain are counted anyway
+            return len(self._counts) - self.limit
+        return self._counts_query().count() - self.limit
+
+    def get_more_choices(self, offset, limit=None):
+        """Returns a list of choices starting from ``offset`` (e.g. when the
+        user expands a limited facet) and a flag telling if there are more.
+        """
+        limit = limit or self.limit
+        clone = copy.copy(self)
+        clone.__dict__.pop('_cache__choices', None)
+        if self.get_domain() is not None:
+            # the domain is counted in a single row and cannot be sliced
+            self.get_counts()
+            rows = self._counts[offset:offset + limit + 1]
+            clone._counts, clone._labels = rows[:limit], self._labels
+        else:
+            rows = list(self.counts_query(offset=offset, limit=limit))
+            clone._counts, clone._labels = clone.convert_counts(rows[:limit],
+                                                                self.sample_rate or 1)
+        clone.options = dict(self.options, limit=None)
+        return list(clone.generate_choices()), len(rows) > limit
+
     @cached_property
     def choices(self):
         """Returns possible choices, each annotated with the number of linked
@@ -438,8 +1229,19 @@ class Filter(object):
           b) it is used but is not in the field's explicit list of choices
              (i.e. the "choices" keyword).
         """
+        if self.filter_list is not None and self.filter_list.executor is not None:
+            self.filter_list.fetch_choices()
+            return self._cache__choices
         return list(self.generate_choices())
 
+    async def achoices(self):
+        """Asynchronous version of ``choices``. The queries are run in a
+        separate thread with its own database connection, so that choices of
+        multiple filters can be fetched concurrently.
+        """
+        get_choices = closing_connections(lambda: self.choices)
+        return await sync_to_async(get_choices, thread_sensitive=False)()
+
     def get_active_choices(self):
         "Returns list of currently selected options for this filter."
         for c in self.choices:
@@ -456,76 +1258,356 @@ class Filter(object):
         how popular is each option). Returns annotated queryset.
         """
         #
-        choices = choices.annotate(items_count=models.Count(by))
+        choices = choices.annotate(items_count=models.Count(by,
+                                            distinct=self.count_distinct))
         if self.sort_by_usage:
             choices = choices.order_by('-items_count')
         return choices
 
+    def get_q(self):
+        """Returns a Q object that selects items matching current value (any
+        of current values if the facet is multiple).
+        """
+        if self.multiple:
+            return models.Q(**{'%s__in' % self.path.value_lookup: self.value})
+        return models.Q(**{self.lookup: self.value})
+
+    def get_condition(self):
+        """Returns the condition applying the filter to the queryset. If the
+        lookup spans a multi-valued relation, it is checked with a correlated
+        EXISTS subquery (unless the facet option ``exists`` is False), so that
+        joins do not duplicate the items and no DISTINCT is needed.
+        """
+        q = self.get_q()
+        if self.path.many and self.options.get('exists', True):
+            matching = self.qs.model._default_manager.filter(q, pk=models.OuterRef('pk'))
+            q = models.Q(models.Exists(matching))
+        return q
+
     def filter(self, qs):
-        return qs.filter(**{self.lookup: self.value})
+        return qs.filter(self.get_condition())
 
 
 class RelationFilter(Filter):
+    count_distinct = True
+
     @classmethod
     def suitable_for(cls, field):
-        if field.rel:
+        if field.is_relation:
             return True
 
     def extra_title(self):
         if isinstance(self.field, models.ManyToManyField):
-            return self.field.rel.to._meta.verbose_name
+            return self.field.related_model._meta.verbose_name
+        if self.field.auto_created:
+            # reverse relation, e.g. "stories" of an author
+            opts = self.field.related_model._meta
+            if self.field.one_to_many or self.field.many_to_many:
+                return opts.verbose_name_plural
+            return opts.verbose_name
+
+    @property
+    def limit_choices_to(self):
+        "Returns constraints from the field definition (if it is a forward one)."
+        if self.field.auto_created:
+            return {}
+        return self.field.remote_field.limit_choices_to
+
+    def get_counted_queryset(self):
+        # apply constraints from field definition and skip objects not
+        # referencing anything
+        conditions = dict(('%s__%s' % (self.field.name, k), v)
+                          for k, v in self.limit_choices_to.items())
+        conditions['%s__isnull' % self.path.value_lookup] = False
+        return self.qs.filter(**conditions)
+
+    def get_label_expression(self):
+        if self.options.get('label'):
+            return models.F('%s__%s' % (self.path.relation, self.options['label']))
+
+    def get_object_columns(self):
+        # group by the related objects' fields so that they could be built
+        # (and their titles taken) without querying the related table again
+        if self.options.get('label'):
+            return {}
+        return dict(('facet_object__%s' % f.attname,
+                     models.F('%s__%s' % (self.path.relation, f.attname)))
+                    for f in self.path.related_model._meta.concrete_fields)
+
+    def _counts_query(self, combined=False):
+        choices = super(RelationFilter, self)._counts_query(combined)
+        if not (combined or self.options.get('label')):
+            # keep the default ordering of the related model (among choices
+            # of equal popularity if sorted by usage)
+            ordering = self.path.related_model._meta.ordering or ['pk']
+            ordering = ['%s%s__%s' % ('-' if o.startswith('-') else '',
+                                      self.path.relation, o.lstrip('-'))
+                        for o in ordering if isinstance(o, str)]
+            if self.sort_by_usage:
+                ordering.insert(0, '-items_count')
+            choices = choices.order_by(*ordering)
+        return choices
+
+    def convert_counts(self, rows, scale=1):
+        # the objects are kept apart from the labels so that they never get
+        # into the cache
+        rows = list(rows)
+        related = self.path.related_model
+        names = [f.attname for f in related._meta.concrete_fields]
+        self._objects = []
+        for row in rows:
+            if 'facet_object__%s' % names[0] in row:
+                self._objects.append(related.from_db(
+                    self.qs.db, names, [row['facet_object__%s' % n] for n in names]))
+        return super(RelationFilter, self).convert_counts(rows, scale)
 
     def generate_choices(self):
-        # TODO: when multiple filters are active, count only intersections (? - can be heavy)
-
-        related_name = getattr(self.field.rel, 'related_name', None) or \
-                self.qs.model._meta.module_name
-        # get all possible choices
-        choices = self.field.rel.to.objects
-        # apply constraints from field definition
-        choices = choices.filter(**self.field.rel.limit_choices_to)
-        # get intersection with current queryset
-        choices = choices.filter(**{'%s__in' % related_name: self.qs })
-        # count usage
-        choices = self._annotate(choices, by=related_name)
-
-        for c in choices:
-            value = c.pk
-            if '__' in self.lookup:
-                try:
-                    _, attr = self.lookup.split('__')
-                except ValueError:
-                    raise ValueError('Facet lookup must contain no more than '
-                                     'two parts (got "%s")' % self.lookup)
-                else:
-                    value = getattr(c, attr)
-            yield FilterChoice(self, str(c), value, c.items_count)
+        counts = self.get_counts()
+        if not counts:
+            return
+        path = self.path
+        label = self.options.get('label')
+        titles = self.get_labels()
+        if label and len(titles) < len(counts):
+            # counts were not fetched by the aggregate query (e.g. taken from
+            # counter tables); fetch only the labels
+            related = path.related_model._default_manager
+            titles = dict(related.filter(**{'%s__in' % path.attr: [v for v, _ in counts]})
+                                 .values_list(path.attr, label))
+        if label:
+            if not self.sort_by_usage:
+                counts = sorted(counts, key=lambda c: str(titles.get(c[0])))
+        else:
+            related = self._objects
+            if len(related) < len(counts):
+                # the objects were not fetched along with the counts (e.g. in
+                # combined mode or from counter tables or cache); fetch them
+                # to get their titles
+                related = path.related_model._default_manager.filter(
+                    **{'%s__in' % path.attr: [v for v, _ in counts]})
+                if path.related_model is self.field.related_model:
+                    related = related.filter(**self.limit_choices_to)
+            titles = dict((getattr(c, path.attr), str(c)) for c in related)
+            if not self.sort_by_usage:
+                order = dict((v, i) for i, v in enumerate(titles))
+                counts = sorted(counts, key=lambda c: order.get(c[0], len(order)))
+        for value, items_count in counts:
+            if value in titles:
+                yield FilterChoice(self, str(titles[value]), value, items_count)
 Filter.register(RelationFilter)
 
 
-'''
-@Filter.register
-class DateFadeoutFilter(Filter):
-    "Represents dates as single-level categories by remoteness from now."
+class DateDrilldownFilter(Filter):
+    """Represents dates as nested levels for year, month and day. Values of
+    the choices look like "2009", "2009-03" and "2009-03-25"; when a year is
+    chosen, its months are displayed, and so on. Counts for each level are
+    grouped by the truncated date within the chosen period.
+    """
+    levels = ('year', 'month', 'day')
 
     @staticmethod
     def suitable_for(field):
-        return isinstance(f, models.DateField)
+        # one of the date filters is chosen automatically (by default this one)
+        return isinstance(field, models.DateField) and \
+            getattr(settings, 'VIEW_SHORTCUTS_DATE_FILTER', 'drilldown') == 'drilldown'
 
-    # see django.contrib.admin.filterspecs.DateFieldFilterSpec
-    pass
+    @staticmethod
+    def parse_period(value):
+        "Returns given choice value as (year[, month[, day]]) or None if it is invalid."
+        try:
+            period = tuple(int(x) for x in value.split('-'))
+            get_date_bounds(*period)
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return period
 
+    @cached_property
+    def period(self):
+        "Returns the chosen period as (year[, month[, day]]) or an empty tuple."
+        return self.parse_period(self.value) or ()
+
+    @property
+    def level(self):
+        "Returns the level of displayed choices: 'year', 'month' or 'day'."
+        return self.levels[min(len(self.period), 2)]
+
+    @property
+    def scope(self):
+        "Returns the period which contains displayed choices (if any)."
+        return self.period[:self.levels.index(self.level)]
+
+    def get_value_expression(self):
+        return Trunc(self.path.value_lookup, self.level)
+
+    def get_counted_queryset(self):
+        qs = self.qs.filter(**{'%s__isnull' % self.path.value_lookup: False})
+        if self.scope:
+            start, end = get_date_range(self.path.target_field, *self.scope)
+            qs = qs.filter(**{'%s__gte' % self.path.value_lookup: start,
+                              '%s__lt' % self.path.value_lookup: end})
+        return qs
+
+    def to_python(self, value):
+        value = super(DateDrilldownFilter, self).to_python(value)
+        if isinstance(value, datetime.datetime):
+            if timezone.is_aware(value):
+                value = timezone.localtime(value)
+            value = value.date()
+        return value
+
+    def get_q(self):
+        # invalid values match nothing
+        q = models.Q(pk__in=[])
+        for period in filter(None, map(self.parse_period, self.values)):
+            start, end = get_date_range(self.path.target_field, *period)
+            q |= models.Q(**{'%s__gte' % self.path.value_lookup: start,
+                             '%s__lt' % self.path.value_lookup: end})
+        return q
 
-@Filter.register
-class DateDrilldownFilter(Filter):
-    "Represents dates as nested levels for year, month and day."
+    def format_date(self, date):
+        "Returns choice value and title for given date at current level."
+        if self.level == 'year':
+            return '%04d' % date.year, str(date.year)
+        if self.level == 'month':
+            return '%04d-%02d' % (date.year, date.month), \
+                   formats.date_format(date, 'YEAR_MONTH_FORMAT')
+        return date.isoformat(), formats.date_format(date, 'MONTH_DAY_FORMAT')
+
+    def generate_choices(self):
+        # counts are grouped here, too, in case they were not truncated by
+        # the database (e.g. taken from counter tables)
+        start, end = get_date_bounds(*self.scope) if self.scope else (None, None)
+        counts = {}
+        for date, items_count in self.get_counts():
+            if date is None or start and not start <= date < end:
+                continue
+            if self.level == 'year':
+                date = date.replace(month=1, day=1)
+            elif self.level == 'month':
+                date = date.replace(day=1)
+            counts[date] = counts.get(date, 0) + items_count
+        for date in sorted(counts):
+            value, title = self.format_date(date)
+            yield FilterChoice(self, title, value, counts[date])
+Filter.register(DateDrilldownFilter)
+
+
+_fadeout_boundaries = {}
+
+class DateFadeoutFilter(Filter):
+    """Represents dates as single-level categories by remoteness from now:
+    today, this week, this month, this year and earlier. Each category
+    except the last one includes the previous ones (e.g. "this month" also
+    covers today). All categories are counted with a single aggregate row.
+
+    The boundaries only change at midnight, so the queries (and cached
+    counts) are the same all day long. With the facet option
+    ``cache_boundaries`` they are computed once a day per process; the
+    ``expires`` attribute tells when they become obsolete, e.g. to limit the
+    lifetime of cached responses.
+
+    This filter is chosen automatically for date fields instead of
+    DateDrilldownFilter if VIEW_SHORTCUTS_DATE_FILTER is set to "fadeout".
+    """
+    periods = (
+        ('today', _('today')),
+        ('week',  _('this week')),
+        ('month', _('this month')),
+        ('year',  _('this year')),
+    )
 
     @staticmethod
     def suitable_for(field):
-        return isinstance(f, models.DateField)
+        return isinstance(field, models.DateField) and \
+            getattr(settings, 'VIEW_SHORTCUTS_DATE_FILTER', 'drilldown') == 'fadeout'
 
-    pass
-'''
+    def to_python(self, value):
+        return value
+
+    @cached_property
+    def boundaries(self):
+        """Returns a dictionary of start dates of the periods (and the end of
+        today as "tomorrow") converted for lookups on the field.
+        """
+        field = self.path.target_field
+        today = get_today()
+        key = (isinstance(field, models.DateTimeField), today,
+               timezone.get_current_timezone_name() if settings.USE_TZ else None)
+        if self.options.get('cache_boundaries') and key in _fadeout_boundaries:
+            return _fadeout_boundaries[key]
+        first_day = formats.get_format('FIRST_DAY_OF_WEEK')
+        week = today - datetime.timedelta(days=(today.isoweekday() - first_day) % 7)
+        month = today.replace(day=1)
+        dates = {
+            'today':    today,
+            'tomorrow': today + datetime.timedelta(days=1),
+            # the week is cut at the start of the month to keep the periods
+            # nested
+            'week':     max(week, month),
+            'month':    month,
+            'year':     today.replace(month=1, day=1),
+        }
+        boundaries = dict((k, to_field_value(field, d)) for k, d in dates.items())
+        if self.options.get('cache_boundaries'):
+            _fadeout_boundaries.clear()
+            _fadeout_boundaries[key] = boundaries
+        return boundaries
+
+    @property
+    def expires(self):
+        "Returns the moment when the boundaries become obsolete."
+        return self.boundaries['tomorrow']
+
+    def get_domain(self):
+        b = self.boundaries
+        lookup = self.path.value_lookup
+        domain = [(value, models.Q(**{'%s__gte' % lookup: b[value],
+                                      '%s__lt' % lookup: b['tomorrow']}))
+                  for value, title in self.periods]
+        domain.append(('older', models.Q(**{'%s__lt' % lookup: b['year']})))
+        return domain
+
+    def gather_row(self, rows):
+        # the items are grouped by the first period they fall into, i.e. the
+        # shortest one, so each period also gets the counts of shorter ones
+        row = super(DateFadeoutFilter, self).gather_row(rows)
+        total = 0
+        for i, (value, title) in enumerate(self.periods):
+            total += row.get('facet_%d' % i, 0)
+            if total:
+                row['facet_%d' % i] = total
+        return row
+
+    def get_buckets(self, value):
+        try:
+            value = self.path.target_field.to_python(value)
+        except ValidationError:
+            return []
+        if value is None:
+            return []
+        b = self.boundaries
+        buckets = [period for period, title in self.periods
+                   if b[period] <= value < b['tomorrow']]
+        if value < b['year']:
+            buckets.append('older')
+        return buckets
+
+    def get_q(self):
+        # unknown values match nothing
+        domain = dict(self.get_domain())
+        q = models.Q(pk__in=[])
+        for value in self.values:
+            if value in domain:
+                q |= domain[value]
+        return q
+
+    def generate_choices(self):
+        counts = dict(self.get_counts())
+        titles = dict(self.periods, older=_('earlier'))
+        for value, q in self.get_domain():
+            if value in counts:
+                yield FilterChoice(self, titles[value], value, counts[value])
+Filter.register(DateFadeoutFilter)
 
 
 class BooleanFilter(Filter):
@@ -533,62 +1615,248 @@ class BooleanFilter(Filter):
     def suitable_for(field):
         return isinstance(field, models.BooleanField)
 
-    def generate_choices(self):
-        # retrieve unique values and count how many times each is used
-        choices = self.qs.values(self.lookup).distinct()
-        choices = self._annotate(choices)
+    def to_python(self, value):
+        # backends represent booleans cast to text differently
+        if isinstance(value, str):
+            return value.lower() in ('1', 't', 'true')
+        return value
+
+    def get_domain(self):
+        domain = [(True,  models.Q(**{self.lookup: True})),
+                  (False, models.Q(**{self.lookup: False}))]
+        if self.path.target_field.null:
+            domain.append((None, models.Q(**{'%s__isnull' % self.path.value_lookup: True})))
+        return domain
+
+    def get_q(self):
+        values = self.values
+        q = models.Q(**{'%s__in' % self.path.value_lookup: [v for v in values if v != 'None']})
+        if 'None' in values:
+            q |= models.Q(**{'%s__isnull' % self.path.value_lookup: True})
+        return q
 
-        bool_choices = (
-            ('True',  _('yes')),
-            ('False', _('no')),
-        )
-        for val,name in bool_choices:
-            for c in choices:
-                v = str(c.get(self.lookup))
-                if v == val:
-                    yield FilterChoice(self, name, val, c['items_count'])
+    def generate_choices(self):
+        counts = dict(self.get_counts())
+        titles = {True: _('yes'), False: _('no'), None: _('unknown')}
+        for value, q in self.get_domain():
+            if value in counts:
+                yield FilterChoice(self, titles[value], str(value), counts[value])
 Filter.register(BooleanFilter)
 
 
 class AlphabeticFilter(Filter):
+    def get_value_expression(self):
+        # group by the first letter in the database so that only a few rows
+        # are fetched regardless of the number of distinct values
+        return Lower(Substr(self.path.value_lookup, 1, 1))
+
     def generate_choices(self):
-        choices = self.qs.values(self.lookup).distinct()
-        choices = self._annotate(choices)
+        choices = self.get_counts()
         chars = {}
-        # compress the list, combine counters
-        for choice in choices:
-            char = str(choice.get(self.lookup))[0].lower()
-            chars[char] = chars.setdefault(char, 0) + 1
+        # combine counters (precomputed counts are stored per whole value)
+        for value, items_count in choices:
+            if not value:
+                continue
+            char = str(value)[0].lower()
+            chars[char] = chars.get(char, 0) + items_count
         for char in sorted(chars.keys()):
             yield FilterChoice(self, char.upper(), char, chars[char])
 
-    def filter(self, qs):
-        assert isinstance(self.value, str)
-        lookup = '%s__startswith' % self.lookup
-        q1 = models.Q(**{lookup: self.value.lower()})
-        q2 = models.Q(**{lookup: self.value.upper()})
-        return qs.filter(q1 | q2)
+    @staticmethod
+    def get_index(field_name, name):
+        """Returns an index on the case-folded field which is used when the
+        items are filtered by first letter. Usage:
 
+            class Author(models.Model):
+                name = models.CharField(max_length=255)
+
+                class Meta:
+                    indexes = [AlphabeticFilter.get_index('name', 'author_name_lower')]
+        """
+        return models.Index(Lower(field_name), name=name)
+
+    def get_q(self):
+        # a half-open range on the case-folded value can be answered from an
+        # index on LOWER(field) (see get_index) instead of scanning the table
+        q = models.Q()
+        for value in self.values:
+            assert isinstance(value, str)
+            start = value.lower()
+            end = start[:-1] + chr(ord(start[-1]) + 1)
+            lower = Lower(self.path.value_lookup)
+            q |= models.Q(GreaterThanOrEqual(lower, start), LessThan(lower, end))
+        return q
+
+
+class RangeFilter(Filter):
+    """Groups numbers into ranges. All ranges are counted with a single
+    aggregate row; choosing a range filters by ``gte`` and ``lt`` lookups.
+
+    The ranges are defined by facet options:
+
+    * ranges -- a list of boundaries, e.g. ``[10, 50, 100]`` makes ranges
+      "less than 10", "10 to 50", "50 to 100" and "100 or more";
+    * buckets -- number of ranges of equal width between the minimum and
+      maximum values (the default is 5);
+    * quantiles -- number of ranges containing roughly equal numbers of
+      items.
+
+    Values of the choices look like "10..50" (either end may be omitted).
+    """
+    @staticmethod
+    def suitable_for(field):
+        return isinstance(field, (models.IntegerField, models.FloatField,
+                                  models.DecimalField)) \
+               and not field.primary_key and not field.choices
+
+    def to_python(self, value):
+        # choices are identified by the range they stand for
+        return value
+
+    @cached_property
+    def boundaries(self):
+        "Returns the sorted list of boundaries between the ranges."
+        if self.options.get('ranges'):
+            return sorted(self.options['ranges'])
+        qs = self.qs.exclude(**{'%s__isnull' % self.path.value_lookup: True})
+        if self.options.get('quantiles'):
+            # values at positions dividing the ordered items into equal parts
+            n = self.options['quantiles']
+            total = qs.count()
+            lookup = self.path.value_lookup
+            ordered = qs.order_by(lookup).values_list(lookup, flat=True)
+            return sorted(set(ordered[total * i // n] for i in range(1, n)
+                              if total * i // n < total))
+        n = self.options.get('buckets', 5)
+        stats = qs.aggregate(low=models.Min(self.path.value_lookup),
+                             high=models.Max(self.path.value_lookup))
+        low, high = stats['low'], stats['high']
+        if low is None:
+            return []
+        if isinstance(self.path.target_field, models.IntegerField):
+            step = lambda i: low + (high - low) * i // n
+        else:
+            step = lambda i: low + (high - low) * i / n
+        # the lowest range starts with the minimum value
+        return sorted(set([low] + [step(i) for i in range(1, n)]))
+
+    @cached_property
+    def ranges(self):
+        "Returns a list of (start, end) pairs; None stands for an open end."
+        edges = self.boundaries
+        if not edges:
+            return []
+        ranges = list(zip([None] + edges, edges + [None]))
+        if not self.options.get('ranges') and not self.options.get('quantiles'):
+            # nothing is below the minimum value
+            ranges = ranges[1:]
+        return ranges
+
+    def format_range(self, start, end):
+        "Returns the choice value for given range."
+        return '%s..%s' % ('' if start is None else start, '' if end is None else end)
+
+    def parse_range(self, value):
+        "Returns (start, end) pair for given choice value or None if it is invalid."
+        to_python = self.path.target_field.to_python
+        try:
+            start, _, end = value.partition('..')
+            return to_python(start) if start else None, to_python(end) if end else None
+        except (AttributeError, TypeError, ValueError, ValidationError):
+            return None
+
+    def get_range_q(self, start, end):
+        q = models.Q()
+        if start is not None:
+            q &= models.Q(**{'%s__gte' % self.path.value_lookup: start})
+        if end is not None:
+            q &= models.Q(**{'%s__lt' % self.path.value_lookup: end})
+        return q
+
+    def get_domain(self):
+        return [(self.format_range(start, end), self.get_range_q(start, end))
+                for start, end in self.ranges]
+
+    def get_buckets(self, value):
+        try:
+            value = self.path.target_field.to_python(value)
+        except ValidationError:
+            return []
+        if value is None:
+            return []
+        return [self.format_range(start, end) for start, end in self.ranges
+                if (start is None or start <= value) and (end is None or value < end)]
+
+    def get_q(self):
+        # invalid values match nothing
+        q = models.Q(pk__in=[])
+        for bounds in filter(None, map(self.parse_range, self.values)):
+            q |= self.get_range_q(*bounds)
+        return q
+
+    def get_title(self, start, end):
+        if start is None:
+            return _('less than %s') % end
+        if end is None:
+            return _('%s or more') % start
+        return _('%(start)s to %(end)s') % {'start': start, 'end': end}
 
-class AllValuesFilter(Filter):
     def generate_choices(self):
-        # retrieve unique values and count how many times each is used
-        choices = self.qs.values(self.lookup).distinct()
-        choices = self._annotate(choices)
+        counts = dict(self.get_counts())
+        for start, end in self.ranges:
+            value = self.format_range(start, end)
+            if value in counts:
+                yield FilterChoice(self, self.get_title(start, end), value,
+                                   counts[value])
+Filter.register(RangeFilter)
+
+
+_choice_titles = {}
+
+def get_choice_titles(field):
+    """Returns a dictionary of titles of the field's explicit choices keyed
+    by value. It is built once per field and rebuilt only if the field's
+    choices are replaced.
+    """
+    choices = field.choices
+    cached = _choice_titles.get(field)
+    if cached is None or cached[0] is not choices:
+        cached = _choice_titles[field] = (choices, dict(field.flatchoices))
+    return cached[1]
 
+
+class AllValuesFilter(Filter):
+    # explicit choices are counted in a single row if there are few of them
+    max_domain_size = 20
+
+    def get_domain(self):
+        if self.field.choices:
+            titles = get_choice_titles(self.field)
+            if len(titles) <= self.max_domain_size:
+                return [(value, models.Q(**{self.lookup: value})) for value in titles]
+        return None
+
+    def get_counted_queryset(self):
+        qs = self.qs
         # if list of choices is explicitly defined, exclude choices that
         # are not in this list (e.g. if the list was added post factum)
         if self.field.choices:
-            explicit_values = [ c[0] for c in self.field.choices ]
-            choices = choices.filter(**{'%s__in' % self.lookup: explicit_values})
+            explicit_values = list(get_choice_titles(self.field))
+            qs = qs.filter(**{'%s__in' % self.path.value_lookup: explicit_values})
+        return qs
 
-        # choice title is its value unless the label is explicitly defined
-        _value = lambda c: str(c.get(self.lookup))
-        _title = lambda c: self.field.choices and \
-                        dict(self.field.choices).get(c.get(self.lookup)) or _value(c)
+    def generate_choices(self):
+        # retrieve unique values and count how many times each is used
+        choices = self.get_counts()
 
-        for c in choices:
-            yield FilterChoice(self, _title(c), _value(c), c['items_count'])
+        # choice title is its value unless the label is explicitly defined
+        titles = get_choice_titles(self.field) if self.field.choices else None
+        for value, items_count in choices:
+            if titles is None:
+                yield FilterChoice(self, str(value), str(value), items_count)
+            elif value in titles:
+                yield FilterChoice(self, titles[value] or str(value), str(value),
+                                   items_count)
 Filter.register(AllValuesFilter)
 
 
@@ -605,16 +1873,30 @@ class FilterChoice(object):
 
     @cached_property
     def urlencode(self):
+        if self.filter.multiple:
+            # add the choice to current ones or remove it if it is selected
+            values = [v for v in self.filter.values if v != str(self.value)]
+            if not self.active:
+                values.append(self.value)
+            return urlencode({self.filter.param: values}, doseq=True)
         value = self.value.encode('utf-8') if isinstance(self.value, str) else self.value
         return urlencode({self.filter.param: value})
 
+    @property
+    def approximate(self):
+        "Returns True if the items count is estimated from a sample."
+        return self.filter.approximate
+
     @cached_property
     def active(self):
-        "Returns True if the choice value equals to the filter's current value."
-        try:
-            return self.value == type(self.value)(self.filter.value)
-        except TypeError as ValueError:
-            return False
+        "Returns True if the choice value equals to (one of) the filter's current value(s)."
+        for value in self.filter.values:
+            try:
+                if self.value == type(self.value)(value):
+                    return True
+            except (TypeError, ValueError):
+                pass
+        return False
 
 
 def filter_params(qs, request, params, single=False):
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2008--2009 Andy Mikhailenko and contributors
+#
+#  This file is part of Django View Shortcuts.
+#
+#  Django View Shortcuts is free software under terms of the GNU Lesser
+#  General Public License version 3 (LGPLv3) as published by the Free
+#  Software Foundation. See the file README for copying conditions.
+#
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from view_shortcuts import counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts facet counts stored for registered models.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help='Models to recount (default: all registered).')
+
+    def handle(self, *args, **options):
+        if options['models']:
+            selected = []
+            for label in options['models']:
+                selected.extend(counters.get_counters(apps.get_model(label)))
+        else:
+            selected = counters.get_counters()
+        for counter in selected:
+            with transaction.atomic():
+                counter.rebuild()
+            if options['verbosity']:
+                self.stdout.write('Rebuilt %s' % counter.label + '.' + counter.lookup)
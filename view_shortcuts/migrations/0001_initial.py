@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('lookup', models.CharField(max_length=255)),
+                ('scope', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255, null=True)),
+                ('items_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('model', 'lookup', 'scope', 'value')},
+            },
+        ),
+    ]
@@ -1 +1,30 @@
- 
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2008--2009 Andy Mikhailenko and contributors
+#
+#  This file is part of Django View Shortcuts.
+#
+#  Django View Shortcuts is free software under terms of the GNU Lesser
+#  General Public License version 3 (LGPLv3) as published by the Free
+#  Software Foundation. See the file README for copying conditions.
+#
+
+from django.db import models
+
+
+class FacetCount(models.Model):
+    """Number of objects of given model within given scope that match given
+    value of a facet lookup. Rows are maintained by view_shortcuts.counters.
+    """
+    model       = models.CharField(max_length=100)
+    lookup      = models.CharField(max_length=255)
+    scope       = models.CharField(max_length=100)
+    value       = models.CharField(max_length=255, null=True)
+    items_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('model', 'lookup', 'scope', 'value')
+
+    def __str__(self):
+        return '%s.%s[%s]=%s: %d' % (self.model, self.lookup, self.scope,
+                                     self.value, self.items_count)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright (c) 2008--2009 Andy Mikhailenko and contributors
+#
+#  This file is part of Django View Shortcuts.
+#
+#  Django View Shortcuts is free software under terms of the GNU Lesser
+#  General Public License version 3 (LGPLv3) as published by the Free
+#  Software Foundation. See the file README for copying conditions.
+#
+
+"""
+Keyset pagination.
+
+Pages are fetched with OFFSET by the standard paginator, so the database has
+to walk through all preceding rows to reach a deep page. Keyset (seek)
+pagination remembers the sort key of the last object on the page instead and
+fetches the next page with ``WHERE (key) > (last key) ... LIMIT n``, which is
+an index range scan no matter how deep the page is.
+
+Usage:
+
+    STORY_ORDERINGS = {
+        'latest': ('-pub_date', '-pk'),
+        'title':  ('title', 'pk'),
+    }
+
+    def story_list(request):
+        filters = FilterList(request, Story.objects.all(), facets)
+        paginator = KeysetPaginator(filters, STORY_ORDERINGS, default='latest')
+        page = paginator.get_page(request)
+        return dict(filters=filters, page=page)
+
+In the template:
+
+    {% for story in page %} ... {% endfor %}
+    {% if page.has_next %}<a href="?{{ page.next_urlencode }}">more</a>{% endif %}
+
+Only forward navigation is supported; the link to the next page keeps the
+active filters and the chosen ordering.
+"""
+
+from urllib.parse import urlencode
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import models
+
+
+class InvalidCursor(ValueError):
+    "The cursor was not issued by the paginator or it does not fit the ordering."
+
+
+class KeysetPage(object):
+    "A page of objects and the cursor pointing to the next page (if any)."
+
+    def __init__(self, paginator, object_list, ordering, next_cursor):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.ordering = ordering
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<KeysetPage %s: %d objects>' % (self.ordering, len(self))
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def next_urlencode(self):
+        """Encodes the active filters, the ordering and the cursor so that they
+        could be added to an URL of the next page as query string.
+        """
+        if not self.has_next:
+            return None
+        return self.paginator.urlencode(self.ordering, self.next_cursor)
+
+
+class KeysetPaginator(object):
+    """Splits objects into pages by the sort key.
+
+    :param objects: a FilterList or a QuerySet;
+    :param orderings: a dictionary of allowed orderings: names and tuples of
+        field names (with "-" for descending order). Only fields of the model
+        itself are allowed; they must not be nullable and must be covered by
+        an index. The primary key is appended unless the ordering already
+        ends with a unique field;
+    :param default: name of the ordering used if none is requested (the
+        first one in alphabetical order by default);
+    :param per_page: number of objects on a page;
+    :param order_param, cursor_param: names of GET parameters.
+
+    Orderings are validated on creation, so a paginator can be declared at
+    import time. Invalid orderings raise ImproperlyConfigured.
+    """
+    salt = 'view_shortcuts.pagination'
+
+    def __init__(self, objects, orderings, default=None, per_page=20,
+                 order_param='order', cursor_param='after'):
+        self.filters = objects if hasattr(objects, 'object_list') else None
+        self.model = objects.model if self.filters is None else objects._qs.model
+        self._objects = objects
+        self.orderings = dict((name, self.check_ordering(ordering))
+                              for name, ordering in orderings.items())
+        self.default = default or sorted(self.orderings)[0]
+        self.per_page = per_page
+        self.order_param = order_param
+        self.cursor_param = cursor_param
+
+    def __repr__(self):
+        return '<KeysetPaginator %s>' % self.model._meta.label
+
+    @property
+    def queryset(self):
+        if self.filters is not None:
+            return self.filters.object_list
+        return self._objects
+
+    def check_ordering(self, ordering):
+        """Returns the ordering as a list of (field, descending) pairs with
+        a unique field in the end. Raises ImproperlyConfigured if it cannot
+        be used.
+        """
+        opts = self.model._meta
+        keys = []
+        for name in ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+            if not getattr(field, 'concrete', False) or field.many_to_many or field.null:
+                raise ImproperlyConfigured('Cannot paginate %s by %s: the field '
+                                           'must be a non-null local one'
+                                           % (opts.label, name))
+            keys.append((field, descending))
+        if not keys[-1][0].unique:
+            keys.append((opts.pk, keys[-1][1]))
+        names = [f.name for f, _ in keys if not f.primary_key]
+        if names and not _has_index(self.model, names):
+            raise ImproperlyConfigured('Cannot paginate %s by %s: no index '
+                                       'starts with these fields'
+                                       % (opts.label, ', '.join(names)))
+        return keys
+
+    def get_ordering(self, request):
+        "Returns name of the requested ordering (or the default one)."
+        name = request.GET.get(self.order_param)
+        return name if name in self.orderings else self.default
+
+    def urlencode(self, ordering, cursor):
+        params = [(self.order_param, ordering), (self.cursor_param, cursor)]
+        if self.filters is not None and self.filters.urlencode:
+            return '%s&%s' % (self.filters.urlencode, urlencode(params))
+        return urlencode(params)
+
+    def encode_cursor(self, ordering, obj):
+        "Returns an opaque string with the sort key of given object."
+        values = [str(f.value_from_object(obj)) for f, _ in self.orderings[ordering]]
+        return signing.dumps([ordering, values], salt=self.salt, compress=True)
+
+    def decode_cursor(self, ordering, cursor):
+        "Returns the sort key stored in the cursor. Raises InvalidCursor."
+        try:
+            name, values = signing.loads(cursor, salt=self.salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        keys = self.orderings[ordering]
+        if name != ordering or len(values) != len(keys):
+            raise InvalidCursor(cursor)
+        try:
+            return [f.to_python(v) for (f, _), v in zip(keys, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+
+    def get_seek_q(self, ordering, values):
+        """Returns a Q object selecting objects that follow given sort key,
+        i.e. ``(a > x) OR (a = x AND b > y) ...``, plus a condition on the
+        first field alone (``a >= x``) which lets the database start the index
+        scan at the key.
+        """
+        keys = self.orderings[ordering]
+        q = models.Q()
+        for i, (field, descending) in enumerate(keys):
+            term = models.Q(**dict((f.attname, v) for (f, _), v in zip(keys[:i], values)))
+            term &= models.Q(**{'%s__%s' % (field.attname, 'lt' if descending else 'gt'): values[i]})
+            q |= term
+        field, descending = keys[0]
+        first = models.Q(**{'%s__%s' % (field.attname, 'lte' if descending else 'gte'): values[0]})
+        return first & q
+
+    def get_page(self, request):
+        """Returns the page requested by GET parameters. Like Django's
+        ``Paginator.get_page``, it never fails: if the cursor has been
+        tampered with or does not fit the ordering (e.g. the ordering was
+        changed in the URL), the first page is returned.
+        """
+        ordering = self.get_ordering(request)
+        keys = self.orderings[ordering]
+        qs = self.queryset.order_by(*[('-' if d else '') + f.attname for f, d in keys])
+        cursor = request.GET.get(self.cursor_param)
+        if cursor:
+            try:
+                values = self.decode_cursor(ordering, cursor)
+            except InvalidCursor:
+                pass
+            else:
+                qs = qs.filter(self.get_seek_q(ordering, values))
+        objects = list(qs[:self.per_page + 1])
+        next_cursor = None
+        if len(objects) > self.per_page:
+            objects = objects[:self.per_page]
+            next_cursor = self.encode_cursor(ordering, objects[-1])
+        return KeysetPage(self, objects, ordering, next_cursor)
+
+
+def _has_index(model, names):
+    "Returns True if an index of the model's table starts with given fields."
+    opts = model._meta
+    field = opts.get_field(names[0])
+    if len(names) == 1 and (field.db_index or field.unique or field.primary_key):
+        return True
+    indexes = [index.fields for index in opts.indexes]
+    indexes += list(opts.unique_together) + list(getattr(opts, 'index_together', ()))
+    for fields in indexes:
+        fields = [opts.get_field(n.lstrip('-')).name for n in fields]
+        if fields[:len(names)] == names:
+            return True
+    return False
@@ -9,17 +9,17 @@ __doc__="""
 >>> s1 = Story(title='s1', text='test', status=Story.PUBLISHED, paid=True)
 >>> s1.save()
 >>> s1.author=a1
->>> s1.categories=[c1,c2]
+>>> s1.categories.set([c1, c2])
 >>> s1.save()
 >>> s2 = Story(title='s2', text='test', status=Story.PUBLISHED, paid=False)
 >>> s2.save()
 >>> s2.author=a2
->>> s2.categories=[c1]
+>>> s2.categories.set([c1])
 >>> s2.save()
 >>> s3 = Story(title='s3', text='test', status=Story.DRAFT, paid=True)
 >>> s3.save()
 >>> s3.author=a1
->>> s3.categories=[c2]
+>>> s3.categories.set([c2])
 >>> s3.save()
 >>> qs = Story.objects.all()
 >>> from view_shortcuts.filters import FilterList, facet, RelationFilter
@@ -40,7 +40,7 @@ True
 >>> filters
 [<RelationFilter "categories__slug": False>, <RelationFilter "author": False>, <AllValuesFilter "status": False>, <BooleanFilter "paid": False>]
 >>> filters.object_list
-[<Story: s1>, <Story: s2>, <Story: s3>]
+<QuerySet [<Story: s1>, <Story: s2>, <Story: s3>]>
 >>> request = mock_request(author=a1.pk)
 >>> filters = FilterList(request, qs, filter_settings)
 >>> filters
@@ -50,7 +50,7 @@ True
 >>> filters.urlencode
 'author=1'
 >>> filters.object_list
-[<Story: s1>, <Story: s3>]
+<QuerySet [<Story: s1>, <Story: s3>]>
 >>> request = mock_request(author=a1.pk, status=Story.PUBLISHED)
 >>> filters = FilterList(request, qs, filter_settings)
 >>> filters.active
@@ -61,35 +61,35 @@ True
 >>> filters
 [<RelationFilter "categories__slug": False>, <RelationFilter "author": True>, <AllValuesFilter "status": True>, <BooleanFilter "paid": False>]
 >>> filters.object_list
-[<Story: s1>]
+<QuerySet [<Story: s1>]>
 >>> flt_author = filters[1]
 >>> flt_author
 <RelationFilter "author": True>
 >>> flt_author.active
 True
 >>> flt_author.title
-u'Written by'
+'Written by'
 >>> flt_author.urlencode
 'author=1'
 >>> flt_author.choices
 [<Choice author="1">, <Choice author="2">]
 >>> [c.title for c in flt_author.choices]
-[u'John', u'Mary']
+['John', 'Mary']
 >>> [c for c in flt_author.get_active_choices()]
 [<Choice author="1">]
 >>> c_a1 = flt_author.get_first_active_choice()
 >>> c_a1
 <Choice author="1">
 >>> c_a1.title
-u'John'
+'John'
 >>> c_a1.urlencode
 'author=1'
 >>> c_a1.items_count
 2
 >>> for f in filters:
-...     print u'%s:   [%s]' % (f.title, f.urlencode)
+...     print('%s:   [%s]' % (f.title, f.urlencode))
 ...     for c in f.choices:
-...         print u'    - %s (%s) --> [%s]' % (c.title, c.items_count, c.urlencode)
+...         print('    - %s (%s) --> [%s]' % (c.title, c.items_count, c.urlencode))
 Category:   [categories__slug=None]
     - News (2) --> [categories__slug=news]
     - Misc (2) --> [categories__slug=misc]
@@ -105,9 +105,9 @@ Paid:   [paid=None]
 >>> qs_predefined = Story.objects.filter(status=Story.PUBLISHED)
 >>> filters = FilterList(request, qs_predefined, filter_settings)
 >>> for f in filters:
-...     print u'%s:   [%s]' % (f.title, f.urlencode)
+...     print('%s:   [%s]' % (f.title, f.urlencode))
 ...     for c in f.choices:
-...         print u'    - %s (%s) --> [%s]' % (c.title, c.items_count, c.urlencode)
+...         print('    - %s (%s) --> [%s]' % (c.title, c.items_count, c.urlencode))
 Category:   [categories__slug=None]
     - News (2) --> [categories__slug=news]
     - Misc (1) --> [categories__slug=misc]
@@ -122,11 +122,11 @@ Paid:   [paid=None]
 >>> qs_predefined = Story.objects.filter(author__name__contains='J')
 >>> filters = FilterList(mock_request(status=Story.PUBLISHED), qs_predefined, filter_settings)
 >>> filters._qs            # predefined query
-[<Story: s1>, <Story: s3>]
+<QuerySet [<Story: s1>, <Story: s3>]>
 >>> filters.clean_query    # query made from scratch, no traces of predefined stuff
-[<Story: s1>, <Story: s2>]
+<QuerySet [<Story: s1>, <Story: s2>]>
 >>> filters.object_list    # intersection between the two
-[<Story: s1>]
+<QuerySet [<Story: s1>]>
 >>> request = mock_request(categories__slug='news')
 >>> filters = FilterList(request, qs, filter_settings)
 >>> filters
@@ -134,7 +134,446 @@ Paid:   [paid=None]
 >>> filters.active
 [<RelationFilter "categories__slug": True>]
 >>> filters.object_list
-[<Story: s1>, <Story: s2>]
+<QuerySet [<Story: s1>, <Story: s2>]>
+
+Active filters are applied with a single condition:
+
+>>> filters = FilterList(mock_request(status=Story.PUBLISHED, author=a1.pk), qs, filter_settings)
+>>> filters.get_q()
+<Q: (AND: ('author', '1'), ('status', 'pub'))>
+>>> filters.object_list
+<QuerySet [<Story: s1>]>
+
+Joined facets on the same multi-valued relation share a single join:
+
+>>> facets = (facet('categories__slug', exists=False),
+...           facet('categories__title', 'category', exists=False))
+>>> request = mock_request(categories__slug='news', category='News')
+>>> filters = FilterList(request, qs, facets)
+>>> str(filters.object_list.query).count(' JOIN ')
+2
+>>> str(filters.clean_query.query).count(' JOIN ')
+2
+>>> filters.object_list
+<QuerySet [<Story: s1>, <Story: s2>]>
+
+Chained filter() calls would join the relation once per condition:
+
+>>> str(qs.filter(categories__slug='news').filter(categories__title='News').query).count(' JOIN ')
+4
+
+Multi-valued relations are checked with EXISTS, so items are not duplicated:
+
+>>> filters = FilterList(mock_request(category='misc'), Author.objects.all(),
+...     (facet('stories__categories__slug', 'category', RelationFilter),))
+>>> filters.object_list
+<QuerySet [<Author: John>]>
+>>> query = str(filters.object_list.query)
+>>> query.count('EXISTS'), query.count('DISTINCT')
+(1, 0)
+>>> filters = FilterList(mock_request(category='misc'), Author.objects.all(),
+...     (facet('stories__categories__slug', 'category', RelationFilter, exists=False),))
+>>> filters.object_list
+<QuerySet [<Author: John>, <Author: John>]>
+
+# Fetch counts for all facets with a single query
+
+>>> from django.db import connection
+>>> from django.test.utils import CaptureQueriesContext
+>>> filters = FilterList(mock_request(), qs, filter_settings, combined=True)
+>>> with CaptureQueriesContext(connection) as queries:
+...     status_choices = filters[2].choices
+...     paid_choices = filters[3].choices
+>>> len(queries)
+1
+>>> [(str(c.title), c.items_count) for c in status_choices]
+[('Published', 2), ('Draft', 1)]
+>>> [(str(c.title), c.items_count) for c in paid_choices]
+[('yes', 2), ('no', 1)]
+>>> [(c.title, c.items_count) for c in filters[1].choices]
+[('John', 2), ('Mary', 1)]
+
+# Titles of related objects are fetched along with the counts otherwise
+
+>>> filters = FilterList(mock_request(), qs, filter_settings)
+>>> with CaptureQueriesContext(connection) as queries:
+...     choices = [(c.title, c.items_count) for c in filters[1].choices]
+>>> choices, len(queries)
+([('John', 2), ('Mary', 1)], 1)
+
+# Count choices with respect to other active filters
+
+>>> request = mock_request(author=a1.pk, status=Story.PUBLISHED)
+>>> filters = FilterList(request, qs, filter_settings, drill_sideways=True)
+>>> for f in filters:
+...     print('%s: %s' % (f.title, ', '.join(['%s (%s)' % (c.title, c.items_count) for c in f.choices])))
+Category: News (1), Misc (1)
+Written by: John (1), Mary (1)
+Status: Draft (1), Published (1)
+Paid: yes (1)
+>>> filters = FilterList(request, qs, filter_settings, drill_sideways=True, combined=True)
+>>> [(c.title, c.items_count) for c in filters[1].choices]
+[('John', 1), ('Mary', 1)]
+
+# Cache choice counts
+
+>>> from view_shortcuts.caching import FacetCache
+>>> cache = FacetCache()
+>>> filters = FilterList(mock_request(), qs, filter_settings, cache=cache)
+>>> [(str(c.title), c.items_count) for c in filters[2].choices]
+[('Published', 2), ('Draft', 1)]
+>>> filters = FilterList(mock_request(), qs, filter_settings, cache=cache)
+>>> with CaptureQueriesContext(connection) as queries:
+...     status_choices = filters[2].choices
+>>> len([q for q in queries if 'GROUP BY' in q['sql']])
+0
+>>> s4 = Story.objects.create(title='s4', text='test', status=Story.DRAFT)
+>>> filters = FilterList(mock_request(), qs, filter_settings, cache=cache)
+>>> sorted([(str(c.title), c.items_count) for c in filters[2].choices])
+[('Draft', 2), ('Published', 2)]
+>>> _ = s4.delete()
+
+Tables of subqueries are followed, too:
+
+>>> request = mock_request(categories__slug='news')
+>>> filters = FilterList(request, qs, filter_settings, drill_sideways=True, cache=cache)
+>>> [(c.title, c.items_count) for c in filters[1].choices]
+[('John', 1), ('Mary', 1)]
+>>> s3.categories.add(c1)
+>>> filters = FilterList(request, qs, filter_settings, drill_sideways=True, cache=cache)
+>>> [(c.title, c.items_count) for c in filters[1].choices]
+[('John', 2), ('Mary', 1)]
+>>> s3.categories.remove(c1)
+
+Only models involved in cached queries get a generation:
+
+>>> cache = FacetCache(prefix='tracking')
+>>> filters = FilterList(mock_request(), qs, filter_settings, cache=cache)
+>>> status_choices = filters[2].choices
+>>> story_generation = cache.storage.get(cache._generation_key(Story))
+>>> a1.save()
+>>> cache.storage.get(cache._generation_key(Author)) is None
+True
+>>> s1.save()
+>>> cache.storage.get(cache._generation_key(Story)) == story_generation + 1
+True
+
+# Read counts from counter tables
+
+>>> from view_shortcuts import counters
+>>> counter = counters.register(Story, 'status')
+>>> counter.rebuild()
+>>> filters = FilterList(mock_request(), qs, filter_settings)
+>>> with CaptureQueriesContext(connection) as queries:
+...     status_choices = filters[2].choices
+>>> [('facetcount' in q['sql'], 'GROUP BY' in q['sql']) for q in queries]
+[(True, False)]
+>>> [(str(c.title), c.items_count) for c in status_choices]
+[('Published', 2), ('Draft', 1)]
+>>> s4 = Story.objects.create(title='s4', text='test', status=Story.PUBLISHED)
+>>> filters = FilterList(mock_request(), qs, filter_settings)
+>>> [(str(c.title), c.items_count) for c in filters[2].choices]
+[('Published', 3), ('Draft', 1)]
+>>> s4.status = Story.DRAFT
+>>> s4.save()
+>>> _ = s4.delete()
+>>> filters = FilterList(mock_request(), qs, filter_settings)
+>>> [(str(c.title), c.items_count) for c in filters[2].choices]
+[('Published', 2), ('Draft', 1)]
+>>> counters.unregister(Story, 'status')
+
+The counter table is created by a migration which matches the model:
+
+>>> from importlib import import_module
+>>> from view_shortcuts.models import FacetCount
+>>> migration = import_module('view_shortcuts.migrations.0001_initial').Migration
+>>> fields = [name for name, _ in migration.operations[0].fields]
+>>> fields == [f.name for f in FacetCount._meta.fields]
+True
+
+# Estimate counts from a sample
+
+>>> filters = FilterList(mock_request(), qs, filter_settings,
+...                      approximate=2, approximate_threshold=0)
+>>> [(str(c.title), c.items_count, c.approximate) for c in filters[2].choices]
+[('Published', 2, True)]
+>>> filters = FilterList(mock_request(), qs, filter_settings, approximate=2)
+>>> [(str(c.title), c.items_count, c.approximate) for c in filters[2].choices]
+[('Published', 2, False), ('Draft', 1, False)]
+
+# Fetch only the most popular choices
+
+>>> filters = FilterList(mock_request(), qs, (facet('author', limit=1),))
+>>> f = filters[0]
+>>> [(c.title, c.items_count) for c in f.choices]
+[('John', 2)]
+>>> f.has_more, f.remaining
+(True, 1)
+>>> choices, has_more = f.get_more_choices(1)
+>>> [(c.title, c.items_count) for c in choices], has_more
+([('Mary', 1)], False)
+>>> filters = FilterList(mock_request(), qs, (facet('paid', limit=1),))
+>>> f = filters[0]
+>>> [(c.title, c.items_count) for c in f.choices], f.has_more, f.remaining
+([('yes', 2)], True, 1)
+>>> choices, has_more = f.get_more_choices(1)
+>>> [(c.title, c.items_count) for c in choices], has_more
+([('no', 1)], False)
+>>> filters = FilterList(mock_request(), qs, (facet('author', min_count=2),))
+>>> [c.title for c in filters[0].choices], filters[0].has_more
+(['John'], False)
+
+# Fetch choices concurrently in async views
+
+>>> from asgiref.sync import async_to_sync
+>>> from view_shortcuts.filters import AsyncFilterList
+>>> filters = AsyncFilterList(mock_request(author=a1.pk), qs, filter_settings)
+>>> async_to_sync(filters.afetch_choices)()
+>>> [(str(c.title), c.items_count) for c in filters[2].choices]
+[('Published', 2), ('Draft', 1)]
+>>> async_to_sync(filters.aobject_list)()
+[<Story: s1>, <Story: s3>]
+
+# Generate choices in parallel threads
+
+>>> filters = FilterList(mock_request(), qs, filter_settings, executor=True)
+>>> [(str(c.title), c.items_count) for c in filters[2].choices]
+[('Published', 2), ('Draft', 1)]
+>>> [(c.title, c.items_count) for c in filters[1].choices]
+[('John', 2), ('Mary', 1)]
+
+# Fetch titles of related objects along with the counts
+
+>>> filters = FilterList(mock_request(), qs, (facet('author', label='name'),))
+>>> with CaptureQueriesContext(connection) as queries:
+...     choices = [(c.title, c.items_count) for c in filters[0].choices]
+>>> choices, len(queries)
+([('John', 2), ('Mary', 1)], 1)
+>>> filters = FilterList(mock_request(), Category.objects.all(),
+...     (facet('stories__author__name', 'author', RelationFilter, label='name'),))
+>>> [(c.title, c.value, c.items_count) for c in filters[0].choices]
+[('John', 'John', 2), ('Mary', 'Mary', 1)]
+
+Reverse relations are titled after the related model:
+
+>>> str(filters[0].title)
+'storys'
+>>> filters = FilterList(mock_request(), Author.objects.all(), (facet('stories'),))
+>>> str(filters[0].title)
+'storys'
+>>> [(c.title, c.items_count) for c in filters[0].choices]
+[('s1', 1), ('s2', 1), ('s3', 1)]
+
+Lookup parts following the fields are kept as transforms and lookups:
+
+>>> from view_shortcuts.filters import LookupPath
+>>> path = LookupPath(Story, 'author__name__iexact')
+>>> [f.name for f in path.fields], path.value_lookup, path.lookup_name, path.attr
+(['author', 'name'], 'author__name', 'iexact', 'name')
+>>> filters = FilterList(mock_request(author='john'), qs,
+...     (facet('author__name__iexact', 'author'),))
+>>> filters.object_list
+<QuerySet [<Story: s1>, <Story: s3>]>
+>>> [(c.title, c.value, c.items_count) for c in filters[0].choices]
+[('John', 'John', 2), ('Mary', 'Mary', 1)]
+
+Cached entries hold the labels but never titles built from related objects:
+
+>>> cache = FacetCache(prefix='labels')
+>>> facets = (facet('author'), facet('author__pk', 'name', label='name'))
+>>> filters = FilterList(mock_request(), qs, facets, cache=cache)
+>>> [c.title for c in filters[0].choices], [c.title for c in filters[1].choices]
+(['John', 'Mary'], ['John', 'Mary'])
+>>> cache.get(filters[0])
+([(1, 2), (2, 1)], {})
+>>> cache.get(filters[1])
+([(1, 2), (2, 1)], {1: 'John', 2: 'Mary'})
+
+Lookups are resolved once per model:
+
+>>> from view_shortcuts.filters import resolve_lookup
+>>> resolve_lookup(Story, 'author__name') is filters[0].path
+False
+>>> resolve_lookup(Story, 'author__name') is resolve_lookup(Story, 'author__name')
+True
+>>> resolve_lookup(Story, 'author__name').target_field is Author._meta.get_field('name')
+True
+
+# Count fixed sets of values in a single row
+
+>>> filters = FilterList(mock_request(), qs, (facet('status'), facet('paid')), combined=True)
+>>> with CaptureQueriesContext(connection) as queries:
+...     choices = [[(str(c.title), c.items_count) for c in f.choices] for f in filters]
+>>> choices, len(queries)
+([[('Published', 2), ('Draft', 1)], [('yes', 2), ('no', 1)]], 1)
+>>> queries[0]['sql'].count('SELECT'), queries[0]['sql'].count('CASE WHEN')
+(2, 2)
+
+# Titles of explicit choices are mapped once per field
+
+>>> from view_shortcuts.filters import get_choice_titles
+>>> field = Story._meta.get_field('status')
+>>> get_choice_titles(field) is get_choice_titles(field)
+True
+>>> choices, field.choices = field.choices, [(Story.PUBLISHED, 'Out')]
+>>> list(get_choice_titles(field).values())
+['Out']
+>>> field.choices = choices
+
+# Select several choices of a facet
+
+>>> filters = FilterList(mock_request(author=[a1.pk, a2.pk]), qs,
+...     (facet('author', multiple=True), facet('status')), drill_sideways=True)
+>>> filters.urlencode
+'author=1&author=2'
+>>> filters[0].get_q()
+<Q: (AND: ('author__in', ['1', '2']))>
+>>> filters.object_list.count()
+3
+>>> [(c.title, c.active, c.urlencode) for c in filters[0].choices]
+[('John', True, 'author=2'), ('Mary', True, 'author=1')]
+>>> filters = FilterList(mock_request(author=a1.pk), qs, (facet('author', multiple=True),))
+>>> [(c.title, c.active, c.urlencode) for c in filters[0].choices]
+[('John', True, ''), ('Mary', False, 'author=1&author=2')]
+
+# Group numbers into ranges
+
+>>> Story.objects.filter(title__in=['s1', 's2']).update(price=5)
+2
+>>> Story.objects.filter(title='s3').update(price=50)
+1
+>>> filters = FilterList(mock_request(price='..10'), qs,
+...                      (facet('price', ranges=[10, 100]),), drill_sideways=True)
+>>> filters
+[<RangeFilter "price": True>]
+>>> [(str(c.title), c.value, c.items_count) for c in filters[0].choices]
+[('less than 10', '..10', 2), ('10 to 100', '10..100', 1)]
+>>> filters.object_list.count()
+2
+>>> filters = FilterList(mock_request(price='ten..'), qs,
+...                      (facet('price', ranges=[10, 100]),), drill_sideways=True)
+>>> filters.object_list.count()
+0
+>>> [c.value for c in filters[0].choices]
+['..10', '10..100']
+>>> counter = counters.register(Story, 'price')
+>>> counter.rebuild()
+>>> filters = FilterList(mock_request(), qs, (facet('price', ranges=[10, 100]),))
+>>> with CaptureQueriesContext(connection) as queries:
+...     choices = [(str(c.title), c.items_count) for c in filters[0].choices]
+>>> choices, ['facetcount' in q['sql'] for q in queries]
+([('less than 10', 2), ('10 to 100', 1)], [True])
+>>> counters.unregister(Story, 'price')
+
+# Drill down dates by year, month and day
+
+>>> import datetime
+>>> utc = datetime.timezone.utc
+>>> Story.objects.filter(title='s1').update(pub_date=datetime.datetime(2009, 3, 2, 10, 0, tzinfo=utc))
+1
+>>> Story.objects.filter(title__in=['s2', 's3']).update(pub_date=datetime.datetime(2009, 5, 1, 12, 0, tzinfo=utc))
+2
+>>> filters = FilterList(mock_request(), qs, (facet('pub_date'),))
+>>> filters, [(c.value, c.items_count) for c in filters[0].choices]
+([<DateDrilldownFilter "pub_date": False>], [('2009', 3)])
+>>> filters = FilterList(mock_request(pub_date='2009'), qs, (facet('pub_date'),))
+>>> [(c.value, c.items_count) for c in filters[0].choices]
+[('2009-03', 1), ('2009-05', 2)]
+>>> filters = FilterList(mock_request(pub_date='2009-03'), qs, (facet('pub_date'),))
+>>> [(c.value, c.items_count) for c in filters[0].choices], filters.object_list
+([('2009-03-02', 1)], <QuerySet [<Story: s1>]>)
+
+Transforms in the lookup change the type of the values:
+
+>>> path = LookupPath(Story, 'pub_date__year')
+>>> path.value_lookup, type(path.target_field).__name__
+('pub_date__year', 'IntegerField')
+>>> from view_shortcuts.filters import AllValuesFilter
+>>> filters = FilterList(mock_request(year='2009'), qs,
+...                      (facet('pub_date__year', 'year', AllValuesFilter),))
+>>> [(c.value, c.items_count) for c in filters[0].choices], filters.object_list.count()
+([('2009', 3)], 3)
+
+Plain views can select periods with a range on the field, too:
+
+>>> from view_shortcuts.filters import filter_date
+>>> filter_date(qs, 'pub_date', '2009', '05')
+<QuerySet [<Story: s2>, <Story: s3>]>
+>>> query = str(filter_date(qs, 'pub_date', 2009, 3, 2).query)
+>>> '>= 2009-03-02 00:00:00' in query, '< 2009-03-03 00:00:00' in query
+(True, True)
+>>> filter_date(qs, 'pub_date', '2009', '04', '31'), filter_date(qs, 'pub_date', '2009', '13')
+(<QuerySet []>, <QuerySet []>)
+>>> from view_shortcuts.filters import filter_date_range
+>>> filter_date_range(qs, ('pub_date', 2009, 3), ('pub_date', 2009, 4))
+<QuerySet [<Story: s1>]>
+>>> query = str(filter_date_range(qs, ('pub_date', 2009, 4), ('pub_date', 2009, 4)).query)
+>>> '>= 2009-04-01 00:00:00' in query, '< 2009-05-01 00:00:00' in query
+(True, True)
+>>> filter_date_range(qs, ('pub_date', 2009, 4, 31), ('pub_date', 2010))
+<QuerySet []>
+>>> filter_date_range(qs, ('pub_date', 2009, 5), ('pub_date', 2009, 3))
+<QuerySet []>
+>>> filter_date_range(qs, ('pub_date', ''), ('pub_date', 2009, 3)).count()
+1
+
+Dates can also be grouped by remoteness from now:
+
+>>> from view_shortcuts.filters import DateFadeoutFilter
+>>> Story.objects.filter(title='s1').update(pub_date=datetime.datetime.now(utc))
+1
+>>> filters = FilterList(mock_request(pub_date='older'), qs,
+...     (facet('pub_date', kind=DateFadeoutFilter),), drill_sideways=True)
+>>> [(str(c.title), c.items_count) for c in filters[0].choices]
+[('today', 1), ('this week', 1), ('this month', 1), ('this year', 1), ('earlier', 2)]
+>>> filters.object_list.count()
+2
+>>> filters = FilterList(mock_request(), qs, (facet('pub_date', kind=DateFadeoutFilter),
+...                                         facet('status')), combined=True)
+>>> [(str(c.title), c.items_count) for c in filters[0].choices]
+[('today', 1), ('this week', 1), ('this month', 1), ('this year', 1), ('earlier', 2)]
+>>> counter = counters.register(Story, 'pub_date')
+>>> counter.rebuild()
+>>> filters = FilterList(mock_request(), qs, (facet('pub_date', kind=DateFadeoutFilter),))
+>>> [(str(c.title), c.items_count) for c in filters[0].choices]
+[('today', 1), ('this week', 1), ('this month', 1), ('this year', 1), ('earlier', 2)]
+>>> counters.unregister(Story, 'pub_date')
+
+# Compile facets once
+
+>>> from view_shortcuts.filters import FacetSet
+>>> story_facets = FacetSet(Story, filter_settings)
+>>> [f['kind'].__name__ for f in story_facets]
+['RelationFilter', 'RelationFilter', 'AllValuesFilter', 'BooleanFilter']
+>>> filters = FilterList(mock_request(author=a1.pk), qs, story_facets)
+>>> filters.object_list
+<QuerySet [<Story: s1>, <Story: s3>]>
+>>> FacetSet(Story, ['publisher'])
+Traceback (most recent call last):
+...
+django.core.exceptions.FieldDoesNotExist: Story has no field named 'publisher'
+
+# Paginate filtered objects by the sort key
+
+>>> from view_shortcuts.pagination import KeysetPaginator
+>>> request = mock_request(status=Story.PUBLISHED)
+>>> filters = FilterList(request, qs, filter_settings)
+>>> paginator = KeysetPaginator(filters, {'latest': ('-pk',)}, per_page=1)
+>>> page = paginator.get_page(request)
+>>> list(page), page.has_next
+([<Story: s2>], True)
+>>> page.next_urlencode.startswith('status=pub&order=latest&after=')
+True
+>>> page = paginator.get_page(RequestFactory().request(QUERY_STRING=page.next_urlencode))
+>>> list(page), page.has_next
+([<Story: s1>], False)
+>>> page = paginator.get_page(mock_request(status=Story.PUBLISHED, after='stale'))
+>>> list(page), page.has_next
+([<Story: s2>], True)
+>>> KeysetPaginator(qs, {'title': ('title',)})
+Traceback (most recent call last):
+...
+django.core.exceptions.ImproperlyConfigured: Cannot paginate view_shortcuts.Story by title: no index starts with these fields
 
 # Test custom filters
 
@@ -151,42 +590,58 @@ Paid:   [paid=None]
 >>> f.choices
 [<Choice name="j">, <Choice name="m">]
 >>> for c in f.choices:
-...     print "%s --> %s" % (c.title, c.urlencode)
+...     print("%s --> %s" % (c.title, c.urlencode))
 J --> name=j
 M --> name=m
 >>> for value in 'j', 'm':
 ...     request = mock_request(name=value)
 ...     filters = FilterList(request, qs, filter_settings)
-...     print "value:", value
+...     print("value:", value)
 ...     for choice in filters[0].get_active_choices():
-...         print '    title "%s", value "%s", %d items' % (choice.title, choice.value, choice.items_count)
+...         print('    title "%s", value "%s", %d items' % (choice.title, choice.value, choice.items_count))
 value: j
     title "J", value "j", 2 items
 value: m
     title "M", value "m", 1 items
 
+The letter is looked up with a range on the case-folded value:
+
+>>> filters[0].get_q()
+<Q: (AND: GreaterThanOrEqual(Lower(F(name)), Value('m')), LessThan(Lower(F(name)), Value('n')))>
+>>> 'lower' in CharField.get_lookups()
+False
+
+Letters are counted in the database and each item is counted once:
+
+>>> filters = FilterList(mock_request(), Story.objects.all(),
+...                      (facet('author__name', 'author', AlphabeticFilter),))
+>>> [(c.title, c.items_count) for c in filters[0].choices]
+[('J', 2), ('M', 1)]
+
 """
 
+import doctest
 import urllib.request, urllib.parse, urllib.error
 from django.test import Client
 from django.core.handlers.wsgi import WSGIRequest
-from django.core.urlresolvers import reverse
-from django.db.models import BooleanField, CharField, ForeignKey, IntegerField, \
-                             ManyToManyField, Model, SlugField, TextField
-from django.utils.translation import ugettext_lazy as _
+from django.urls import reverse
+from django.db.models import BooleanField, CharField, DateTimeField, ForeignKey, \
+                             IntegerField, ManyToManyField, Model, SlugField, \
+                             TextField, SET_NULL
+from django.utils.translation import gettext_lazy as _
 
 
 class Author(Model):
     name = CharField(max_length=255)
 
-    __unicode__ = lambda s: s.name
+    __str__ = lambda s: s.name
 
 
 class Category(Model):
     title = CharField(max_length=255)
     slug  = SlugField()
 
-    __unicode__ = lambda s: s.title
+    __str__ = lambda s: s.title
 
 
 class Story(Model):
@@ -199,13 +654,15 @@ class Story(Model):
     status   = CharField(_('Status'), max_length=255,
                          choices=STORY_STATUS_CHOICES, default=DRAFT)
     author   = ForeignKey(Author, related_name='stories', null=True,
-                          verbose_name=_('Written by'))
-    categories = ManyToManyField(Category, null=True, related_name='stories',
+                          on_delete=SET_NULL, verbose_name=_('Written by'))
+    categories = ManyToManyField(Category, related_name='stories',
                                verbose_name=_('Category'))
     text     = TextField()
-    paid     = BooleanField(_('Paid'))
+    paid     = BooleanField(_('Paid'), default=False)
+    price    = IntegerField(_('Price'), null=True)
+    pub_date = DateTimeField(_('Published on'), null=True)
 
-    __unicode__ = lambda s: s.title
+    __str__ = lambda s: s.title
     get_url     = lambda s: reverse('example-story-detail',
                                     urlconf=None, args=None,
                                     kwargs=dict(object_id=s.pk))
@@ -234,19 +691,17 @@ class RequestFactory(Client):
         Similar to parent class, but returns the request object as soon as it
         has created it.
         """
-        environ = {
-            'HTTP_COOKIE': self.cookies,
-            'PATH_INFO': '/',
-            'QUERY_STRING': '',
-            'REQUEST_METHOD': 'GET',
-            'SCRIPT_NAME': '',
-            'SERVER_NAME': 'testserver',
-            'SERVER_PORT': 80,
-            'SERVER_PROTOCOL': 'HTTP/1.1',
-        }
-        environ.update(self.defaults)
-        environ.update(request)
+        environ = self._base_environ(**request)
         return WSGIRequest(environ)
 
 def mock_request(**kw):
-    return RequestFactory().request(QUERY_STRING=urllib.parse.urlencode(kw))
+    return RequestFactory().request(QUERY_STRING=urllib.parse.urlencode(kw, doseq=True))
+
+
+def load_tests(loader, tests, pattern):
+    doctests = doctest.DocTestSuite()
+    for test in doctests:
+        # make the runner set up the test database for the doctests
+        test.databases = {'default'}
+    tests.addTests(doctests)
+    return tests